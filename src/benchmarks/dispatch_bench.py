@@ -0,0 +1,88 @@
+"""Throughput of items scraped by rmq_callback with task events delivered through scrapy signals
+and in direct dispatch mode (RMQ_DIRECT_DISPATCH).
+
+Usage (from src directory): python benchmarks/dispatch_bench.py
+"""
+import os
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scrapy import Field, Item, Spider, signals  # noqa: E402
+from scrapy.crawler import Crawler  # noqa: E402
+from scrapy.http import HtmlResponse, Request  # noqa: E402
+from scrapy.settings import Settings  # noqa: E402
+
+from rmq.extensions import RPCTaskConsumer  # noqa: E402
+from rmq.utils import RMQConstants, Task, TaskObserver  # noqa: E402
+from rmq.utils.decorators import rmq_callback  # noqa: E402
+
+TASKS_COUNT = 2000
+ITEMS_PER_TASK = 50
+RUNS_COUNT = 3
+
+
+class BenchItem(Item):
+    value = Field()
+
+
+class BenchSpider(Spider):
+    name = "dispatch_bench"
+    task_queue_name = "dispatch_bench"
+
+    @rmq_callback
+    def parse(self, response):
+        for i in range(ITEMS_PER_TASK):
+            yield BenchItem(value=i)
+
+
+def run(direct_dispatch):
+    crawler = Crawler(
+        BenchSpider, Settings({"RMQ_DIRECT_DISPATCH": direct_dispatch, "LOG_ENABLED": False})
+    )
+    spider = BenchSpider()
+    spider.crawler = crawler
+    spider.settings = crawler.settings
+    spider.processing_tasks = TaskObserver()
+    consumer = RPCTaskConsumer.from_crawler(crawler)
+    consumer._RPCTaskConsumer__spider = spider
+    consumer.completion_strategy = RPCTaskConsumer.CompletionStrategies.WEAK_ITEMS_BASED
+    if direct_dispatch:
+        consumer._external_receivers = {
+            signal: consumer._has_receivers(signal) for signal in consumer._external_receivers
+        }
+        spider.processing_tasks.set_listener(consumer)
+    delivery_tag_meta_key = RMQConstants.DELIVERY_TAG_META_KEY.value
+    properties = types.SimpleNamespace(reply_to=None)
+    started_at = time.perf_counter()
+    for delivery_tag in range(TASKS_COUNT):
+        spider.processing_tasks.add_task(
+            Task(
+                {
+                    "method": types.SimpleNamespace(delivery_tag=delivery_tag),
+                    "properties": properties,
+                    "body": b"{}",
+                }
+            )
+        )
+        response = HtmlResponse(
+            "http://example.com",
+            body=b"",
+            request=Request("http://example.com", meta={delivery_tag_meta_key: delivery_tag}),
+        )
+        for item in spider.parse(response):
+            crawler.signals.send_catch_log(
+                signal=signals.item_scraped, item=item, response=response, spider=spider
+            )
+    elapsed = time.perf_counter() - started_at
+    assert spider.processing_tasks.is_empty(), spider.processing_tasks.current_processing_count()
+    return TASKS_COUNT * ITEMS_PER_TASK / elapsed
+
+
+if __name__ == "__main__":
+    for direct_dispatch in (False, True):
+        items_per_second = max(run(direct_dispatch) for _ in range(RUNS_COUNT))
+        mode = "direct" if direct_dispatch else "signals"
+        print(f"{mode}: {items_per_second:,.0f} items/s")
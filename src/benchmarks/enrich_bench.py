@@ -0,0 +1,71 @@
+"""Throughput of task messages turned into scheduled requests by RPCTaskConsumer
+(request enrichment with task meta included).
+
+Usage (from src directory): python benchmarks/enrich_bench.py
+"""
+import json
+import os
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scrapy import Request, Spider  # noqa: E402
+from scrapy.crawler import Crawler  # noqa: E402
+from scrapy.settings import Settings  # noqa: E402
+
+from rmq.extensions import RPCTaskConsumer  # noqa: E402
+from rmq.utils import TaskObserver  # noqa: E402
+
+MESSAGES_COUNT = 20000
+RUNS_COUNT = 3
+
+body = json.dumps(
+    {
+        "id": 1,
+        "url": "http://example.com/item/1",
+        "fields": {"a": list(range(20)), "b": "x" * 200},
+    }
+).encode()
+
+
+class BenchSpider(Spider):
+    name = "enrich_bench"
+
+    def next_request(self, delivery_tag, msg_body):
+        data = json.loads(msg_body)
+        return Request(data["url"], meta={"ctx": {"id": data["id"], "tags": ["a", "b", "c"]}})
+
+
+def run():
+    crawler = Crawler(BenchSpider, Settings({"LOG_ENABLED": False}))
+    spider = BenchSpider()
+    spider.crawler = crawler
+    spider.processing_tasks = TaskObserver()
+    consumer = RPCTaskConsumer.from_crawler(crawler)
+    consumer._RPCTaskConsumer__spider = spider
+    consumer.rmq_connection = types.SimpleNamespace(connection=None, options={})
+    scheduled = []
+    crawler.engine = types.SimpleNamespace(
+        crawl=lambda request, spider=None: scheduled.append(request)
+    )
+    properties = types.SimpleNamespace(reply_to=None)
+    messages = [
+        {
+            "method": types.SimpleNamespace(delivery_tag=i, redelivered=False),
+            "properties": properties,
+            "body": body,
+        }
+        for i in range(MESSAGES_COUNT)
+    ]
+    started_at = time.perf_counter()
+    for message in messages:
+        consumer.on_basic_get_message(message)
+    elapsed = time.perf_counter() - started_at
+    assert len(scheduled) == MESSAGES_COUNT and scheduled[0].dont_filter
+    return MESSAGES_COUNT / elapsed
+
+
+if __name__ == "__main__":
+    print(f"{max(run() for _ in range(RUNS_COUNT)):,.0f} messages/s")
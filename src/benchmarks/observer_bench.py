@@ -0,0 +1,47 @@
+"""TaskObserver bookkeeping cost per task (best of several runs).
+
+Usage (from src directory): python benchmarks/observer_bench.py
+"""
+import os
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rmq.utils import Task, TaskObserver  # noqa: E402
+
+TASKS_COUNT = 100000
+RUNS_COUNT = 5
+
+
+def run(tasks):
+    observer = TaskObserver()
+    started_at = time.perf_counter()
+    for task in tasks:
+        observer.add_task(task)
+        delivery_tag = task.delivery_tag
+        observer.handle_request(delivery_tag)
+        observer.handle_response(delivery_tag, 200)
+        observer.handle_item_scheduled(delivery_tag)
+        observer.handle_item_scraped(delivery_tag)
+        task.is_requests_completed()
+        task.is_items_completed()
+        observer.remove_task(delivery_tag)
+    return time.perf_counter() - started_at
+
+
+if __name__ == "__main__":
+    properties = types.SimpleNamespace(reply_to=None)
+    tasks = [
+        Task(
+            {
+                "method": types.SimpleNamespace(delivery_tag=i),
+                "properties": properties,
+                "body": b"{}",
+            }
+        )
+        for i in range(TASKS_COUNT)
+    ]
+    best = min(run(tasks) for _ in range(RUNS_COUNT))
+    print(f"observer ops for {TASKS_COUNT} tasks: {best:.3f}s")
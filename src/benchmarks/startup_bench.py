@@ -0,0 +1,85 @@
+"""Spider validation cost on RPCTaskConsumer startup: dir() scan of spider attributes (previous
+implementation, triggers every property) against registry of rmq decorated methods.
+
+Usage (from src directory): python benchmarks/startup_bench.py
+"""
+import os
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import scrapy  # noqa: E402
+
+from rmq.extensions import RPCTaskConsumer  # noqa: E402
+from rmq.utils import TaskObserver  # noqa: E402
+from rmq.utils.decorators import rmq_callback, rmq_errback  # noqa: E402
+
+PROPERTIES_COUNT = 50
+REPEATS_COUNT = 10000
+
+
+def heavy_property(self):
+    time.sleep(0.001)
+    return 1
+
+
+BaseBenchSpider = type(
+    "BaseBenchSpider",
+    (scrapy.Spider,),
+    {
+        "name": "startup_bench",
+        "task_queue_name": "startup_bench",
+        **{f"lazy_{i}": property(heavy_property) for i in range(PROPERTIES_COUNT)},
+    },
+)
+
+
+class BenchSpider(BaseBenchSpider):
+    @rmq_callback
+    def parse(self, response):
+        yield None
+
+    @rmq_errback
+    def _errback(self, failure):
+        yield None
+
+
+def scan_validate(spider):
+    attributes = [a for a in dir(spider) if not callable(getattr(spider, a))]
+    methods = [m for m in dir(spider) if callable(getattr(spider, m)) and not m.startswith("__")]
+    decorated_count = 0
+    for method_name in methods:
+        method = getattr(spider, method_name)
+        if hasattr(method, "__wrapped__") and hasattr(method, "__decorator_name__"):
+            decorated_count += 1
+    return "task_queue_name" in attributes and decorated_count > 0
+
+
+def registry_validate(consumer):
+    return (
+        consumer._validate_spider_has_attributes() is not False
+        and consumer._validate_spider_has_decorators() is not False
+    )
+
+
+if __name__ == "__main__":
+    spider = BenchSpider()
+    spider.processing_tasks = TaskObserver()
+    consumer = RPCTaskConsumer(
+        types.SimpleNamespace(settings=scrapy.settings.Settings({}), stats=None)
+    )
+    consumer._RPCTaskConsumer__spider = spider
+    for label, validate in (
+        ("dir() scan", lambda: scan_validate(spider)),
+        ("registry", lambda: registry_validate(consumer)),
+    ):
+        started_at = time.perf_counter()
+        result = validate()
+        print(f"{label}: {result} {(time.perf_counter() - started_at) * 1000:.2f} ms")
+    started_at = time.perf_counter()
+    for _ in range(REPEATS_COUNT):
+        registry_validate(consumer)
+    elapsed = time.perf_counter() - started_at
+    print(f"registry x{REPEATS_COUNT}: {elapsed * 1000:.1f} ms")
@@ -0,0 +1,69 @@
+"""Task lifecycle throughput and memory retained per in-flight task.
+
+Usage (from src directory): python benchmarks/task_bench.py
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rmq.utils import Task, TaskObserver  # noqa: E402
+
+TASKS_COUNT = 100000
+RETAINED_TASKS_COUNT = 10000
+
+body = json.dumps({"url": "https://example.com/some/path", "id": 12345}).encode()
+properties = types.SimpleNamespace(reply_to="replies", headers=None, message_id=None)
+
+
+def build_message(delivery_tag):
+    return {
+        "channel": object(),
+        "method": types.SimpleNamespace(delivery_tag=delivery_tag, redelivered=False),
+        "properties": properties,
+        "body": body,
+    }
+
+
+def noop():
+    return None
+
+
+def run_lifecycles():
+    messages = [build_message(i) for i in range(1, TASKS_COUNT + 1)]
+    observer = TaskObserver()
+    started_at = time.perf_counter()
+    for message in messages:
+        task = Task(message, noop, noop)
+        observer.add_task(task)
+        delivery_tag = task.delivery_tag
+        observer.handle_request(delivery_tag)
+        observer.handle_response(delivery_tag, 200)
+        observer.handle_item_scheduled(delivery_tag)
+        observer.handle_item_scraped(delivery_tag)
+        task.is_requests_completed()
+        task.is_items_completed()
+        task.ack()
+        observer.remove_task(delivery_tag)
+    return time.perf_counter() - started_at
+
+
+def measure_retained_size():
+    tracemalloc.start()
+    tasks = [Task(build_message(i), noop, noop) for i in range(1, RETAINED_TASKS_COUNT + 1)]
+    current_size, _peak_size = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del tasks
+    return current_size / RETAINED_TASKS_COUNT
+
+
+if __name__ == "__main__":
+    elapsed = run_lifecycles()
+    print(
+        f"{TASKS_COUNT} lifecycles: {elapsed:.3f}s ({TASKS_COUNT / elapsed:,.0f}/s); "
+        f"retained per in-flight task: {measure_retained_size():.0f} B"
+    )
@@ -0,0 +1,3 @@
+# -*- coding: utf-8 -*-
+from .bloom_dupefilter import BloomDupeFilter
+from .bloom_filter import RotatingBloomFilter
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import logging
+import os
+
+from scrapy.dupefilters import BaseDupeFilter
+from scrapy.utils.project import data_path
+
+from rmq.utils import RMQConstants
+
+from .bloom_filter import RotatingBloomFilter
+
+logger = logging.getLogger(__name__)
+
+
+class BloomDupeFilter(BaseDupeFilter):
+    """Request fingerprints dupefilter with fixed memory footprint backed by RotatingBloomFilter.
+
+    With DUPEFILTER_BLOOM_SHARED filter file is kept between runs and shared by spiders running
+    on one host. Otherwise default filter file is private to spider process (several instances of
+    one spider may run on the host) and is removed on close, DUPEFILTER_BLOOM_PATH of filter which
+    is not shared must be unique per process. With DUPEFILTER_TASK_SCOPED requests are
+    deduplicated within their rmq task only: fingerprint is salted with random id of task delivery,
+    so repeated or redelivered tasks crawl the same urls again. Fingerprints of finished tasks are
+    forgotten with rotation of filter slices
+    """
+
+    def __init__(
+        self,
+        bloom_filter,
+        fingerprinter=None,
+        task_scoped=False,
+        debug=False,
+        crawler=None,
+        remove_on_close=False,
+    ):
+        self.bloom_filter = bloom_filter
+        self.fingerprinter = fingerprinter
+        self.task_scoped = task_scoped
+        self.debug = debug
+        self.crawler = crawler
+        self.remove_on_close = remove_on_close
+        self.delivery_tag_meta_key = RMQConstants.DELIVERY_TAG_META_KEY.value
+        self.scope_token = os.urandom(8)
+        self.filtered_count = 0
+
+    @classmethod
+    def from_settings(cls, settings, fingerprinter=None, crawler=None):
+        shared = settings.getbool("DUPEFILTER_BLOOM_SHARED", False)
+        path = settings.get("DUPEFILTER_BLOOM_PATH")
+        remove_on_close = False
+        if not path:
+            filename = "requests.bloom" if shared else "requests.{}.bloom".format(os.getpid())
+            path = os.path.join(data_path("bloom", createdir=True), filename)
+            remove_on_close = not shared
+        bloom_filter = RotatingBloomFilter(
+            path,
+            capacity=settings.getint("DUPEFILTER_BLOOM_CAPACITY", 1000000),
+            error_rate=settings.getfloat("DUPEFILTER_BLOOM_ERROR_RATE", 0.001),
+            slices=settings.getint("DUPEFILTER_BLOOM_SLICES", 4),
+            shared=shared,
+        )
+        return cls(
+            bloom_filter,
+            fingerprinter=fingerprinter,
+            task_scoped=settings.getbool("DUPEFILTER_TASK_SCOPED", False),
+            debug=settings.getbool("DUPEFILTER_DEBUG", False),
+            crawler=crawler,
+            remove_on_close=remove_on_close,
+        )
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls.from_settings(
+            crawler.settings, getattr(crawler, "request_fingerprinter", None), crawler
+        )
+
+    def open(self):
+        self.bloom_filter.open()
+
+    def close(self, reason):
+        self.bloom_filter.close()
+        if self.remove_on_close:
+            try:
+                os.remove(self.bloom_filter.path)
+            except OSError:
+                logger.warning(f"Bloom filter file {self.bloom_filter.path} is not removed")
+
+    def _get_task_salt(self, request):
+        """Random id of request task delivery (see Task.task_id)"""
+        meta = request.meta
+        delivery_tag = meta.get(self.delivery_tag_meta_key, None)
+        if delivery_tag is None:
+            return None
+        spider = getattr(self.crawler, "spider", None)
+        processing_tasks = getattr(spider, "processing_tasks", None)
+        task = processing_tasks.get_task(delivery_tag) if processing_tasks is not None else None
+        if task is not None:
+            return task.task_id
+        # Task is already finalized or filter is used without crawler
+        return self.scope_token + str(delivery_tag).encode()
+
+    def _get_key(self, request):
+        if self.fingerprinter is not None:
+            fingerprint = self.fingerprinter.fingerprint(request)
+        else:
+            from scrapy.utils.request import request_fingerprint
+
+            fingerprint = bytes.fromhex(request_fingerprint(request))
+        if self.task_scoped:
+            salt = self._get_task_salt(request)
+            if salt is not None:
+                return hashlib.blake2b(salt + b"|" + fingerprint, digest_size=16).digest()
+        return fingerprint
+
+    def request_seen(self, request):
+        return self.bloom_filter.add(self._get_key(request))
+
+    def log(self, request, spider):
+        self.filtered_count += 1
+        if self.debug:
+            logger.debug(f"Filtered duplicate request: {request}")
+        elif self.filtered_count == 1:
+            logger.debug(
+                f"Filtered duplicate request: {request} - no more duplicates will be shown "
+                f"(see DUPEFILTER_DEBUG to show all duplicates)"
+            )
+        spider.crawler.stats.inc_value("dupefilter/filtered", spider=spider)
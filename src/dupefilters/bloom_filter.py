@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+import math
+import mmap
+import os
+import struct
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows: filter can not be shared between processes
+    fcntl = None
+
+
+class RotatingBloomFilter:
+    """Bloom filter persisted in memory mapped file.
+
+    Filter consists of fixed number of slices with capacity items each. Items are added to current
+    slice, when it is full the oldest slice is cleared and becomes current one, so memory is fixed
+    and items are forgotten after (slices - 1) * capacity newer items. With shared=True file
+    updates are serialized with flock and filter can be used by several processes on one host.
+    Shared file of other filter parameters is not rebuilt (other processes may have it mapped)
+    """
+
+    MAGIC = b"RMQBLOOM"
+    # magic, slices, hashes count, bits per slice, current slice
+    _HEADER = struct.Struct("<8sIIQI")
+
+    def __init__(self, path, capacity=1000000, error_rate=0.001, slices=4, shared=False):
+        self.path = path
+        self.capacity = max(1, int(capacity))
+        self.slices = max(2, int(slices))
+        self.shared = shared and fcntl is not None
+        # Lookup checks every slice, so false positive rate of single slice is lowered
+        slice_error_rate = error_rate / self.slices
+        bits = -self.capacity * math.log(slice_error_rate) / (math.log(2) ** 2)
+        self.slice_bytes = int(math.ceil(bits / 8))
+        self.bits_per_slice = self.slice_bytes * 8
+        self.hashes_count = max(1, int(round(self.bits_per_slice / self.capacity * math.log(2))))
+        self.counts_offset = self._HEADER.size
+        self.data_offset = self.counts_offset + 8 * self.slices
+        self.size = self.data_offset + self.slice_bytes * self.slices
+        self.__file = None
+        self.__mmap = None
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.__file = open(self.path, "a+b")
+        try:
+            self._map()
+        except ValueError:
+            self.__file.close()
+            self.__file = None
+            raise
+
+    def _map(self):
+        with self._locked():
+            self.__file.seek(0, os.SEEK_END)
+            file_size = self.__file.tell()
+            is_valid = file_size == self.size
+            if is_valid:
+                self.__file.seek(0)
+                header = self._HEADER.unpack(self.__file.read(self._HEADER.size))
+                is_valid = header[:4] == (
+                    self.MAGIC,
+                    self.slices,
+                    self.hashes_count,
+                    self.bits_per_slice,
+                )
+            if not is_valid and self.shared and file_size > 0:
+                # Resizing file mapped by other processes would crash them (SIGBUS)
+                raise ValueError(
+                    f"Shared bloom filter file {self.path} has other filter parameters, "
+                    f"remove it once no process uses it or use another path"
+                )
+            if not is_valid:
+                # New file or filter parameters are changed
+                self.__file.truncate(0)
+                self.__file.truncate(self.size)
+            self.__mmap = mmap.mmap(self.__file.fileno(), self.size)
+            if not is_valid:
+                self._HEADER.pack_into(
+                    self.__mmap,
+                    0,
+                    self.MAGIC,
+                    self.slices,
+                    self.hashes_count,
+                    self.bits_per_slice,
+                    0,
+                )
+
+    def close(self):
+        if self.__mmap is not None:
+            self.__mmap.flush()
+            self.__mmap.close()
+            self.__mmap = None
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
+
+    @contextmanager
+    def _locked(self):
+        if not self.shared:
+            yield
+            return
+        fcntl.flock(self.__file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self.__file.fileno(), fcntl.LOCK_UN)
+
+    def _get_bits(self, key):
+        """Double hashing of key which must be uniformly distributed digest (16+ bytes)"""
+        h1 = int.from_bytes(key[:8], "little")
+        h2 = int.from_bytes(key[8:16], "little") | 1
+        bits_per_slice = self.bits_per_slice
+        return [(h1 + i * h2) % bits_per_slice for i in range(self.hashes_count)]
+
+    def _slice_contains(self, slice_index, bits):
+        buffer = self.__mmap
+        offset = self.data_offset + slice_index * self.slice_bytes
+        for bit in bits:
+            if not buffer[offset + (bit >> 3)] & (1 << (bit & 7)):
+                return False
+        return True
+
+    def _get_current_slice(self):
+        return struct.unpack_from("<I", self.__mmap, self._HEADER.size - 4)[0]
+
+    def _rotate(self, current_slice):
+        current_slice = (current_slice + 1) % self.slices
+        offset = self.data_offset + current_slice * self.slice_bytes
+        self.__mmap[offset : offset + self.slice_bytes] = bytes(self.slice_bytes)
+        struct.pack_into("<Q", self.__mmap, self.counts_offset + 8 * current_slice, 0)
+        struct.pack_into("<I", self.__mmap, self._HEADER.size - 4, current_slice)
+        return current_slice
+
+    def add(self, key):
+        """Adds key, returns True if it was (probably) already added"""
+        bits = self._get_bits(key)
+        with self._locked():
+            for slice_index in range(self.slices):
+                if self._slice_contains(slice_index, bits):
+                    return True
+            current_slice = self._get_current_slice()
+            count_offset = self.counts_offset + 8 * current_slice
+            count = struct.unpack_from("<Q", self.__mmap, count_offset)[0]
+            if count >= self.capacity:
+                current_slice = self._rotate(current_slice)
+                count_offset = self.counts_offset + 8 * current_slice
+                count = 0
+            buffer = self.__mmap
+            offset = self.data_offset + current_slice * self.slice_bytes
+            for bit in bits:
+                buffer[offset + (bit >> 3)] |= 1 << (bit & 7)
+            struct.pack_into("<Q", buffer, count_offset, count + 1)
+        return False
@@ -1 +1,2 @@
 # -*- coding: utf-8 -*-
+from .sqlite_cache_storage import SQLiteCacheStorage
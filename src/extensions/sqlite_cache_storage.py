@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+import logging
+import os
+import pickle
+import sqlite3
+import time
+import zlib
+
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+from scrapy.utils.project import data_path
+from twisted.internet import task
+
+try:
+    import zstandard
+except ImportError:
+    # Optional dependency: responses are compressed with zlib without it
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteCacheStorage:
+    """HTTP cache storage packing compressed responses into single SQLite file per spider.
+
+    Entries are keyed by request fingerprint and expire after HTTPCACHE_EXPIRATION_SECS or
+    request meta "cache_ttl" seconds (0 never expires). Writes are committed in batches of
+    HTTPCACHE_SQLITE_BATCH_SIZE entries (or every HTTPCACHE_SQLITE_FLUSH_INTERVAL seconds) and
+    least recently used entries are evicted when HTTPCACHE_MAX_SIZE bytes is exceeded
+    """
+
+    CODEC_ZLIB = "zlib"
+    CODEC_ZSTD = "zstd"
+    _EVICTION_RATIO = 0.9
+
+    def __init__(self, settings):
+        self.cachedir = data_path(settings["HTTPCACHE_DIR"], createdir=True)
+        self.expiration_secs = settings.getint("HTTPCACHE_EXPIRATION_SECS", 0)
+        self.max_size = settings.getint("HTTPCACHE_MAX_SIZE", 1073741824)
+        self.batch_size = max(1, settings.getint("HTTPCACHE_SQLITE_BATCH_SIZE", 100))
+        self.flush_interval = settings.getfloat("HTTPCACHE_SQLITE_FLUSH_INTERVAL", 5.0)
+        self.codec = self.CODEC_ZSTD if zstandard is not None else self.CODEC_ZLIB
+        self.db = None
+        self.total_size = 0
+        self._fingerprint = None
+        self.__pending_writes = {}
+        self.__pending_touches = {}
+        self.__flush_task = None
+        if zstandard is not None:
+            self.__compressor = zstandard.ZstdCompressor(level=3)
+            self.__decompressor = zstandard.ZstdDecompressor()
+
+    def open_spider(self, spider):
+        dbpath = os.path.join(self.cachedir, "{}.sqlite".format(spider.name))
+        self.db = sqlite3.connect(dbpath)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "fingerprint TEXT PRIMARY KEY, url TEXT, status INTEGER, headers BLOB, body BLOB, "
+            "codec TEXT, size INTEGER, created_at REAL, expires_at REAL, accessed_at REAL)"
+        )
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)"
+        )
+        self.db.commit()
+        self.total_size = self.db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()[0]
+        fingerprinter = getattr(spider.crawler, "request_fingerprinter", None)
+        if fingerprinter is not None:
+            self._fingerprint = lambda request: fingerprinter.fingerprint(request).hex()
+        else:
+            from scrapy.utils.request import request_fingerprint
+
+            self._fingerprint = request_fingerprint
+        logger.debug(f"Using SQLite cache storage in {dbpath} ({self.total_size} bytes)")
+        if self.flush_interval > 0:
+            self.__flush_task = task.LoopingCall(self.flush)
+            self.__flush_task.start(self.flush_interval, now=False)
+
+    def close_spider(self, spider):
+        if self.__flush_task is not None and self.__flush_task.running:
+            self.__flush_task.stop()
+        self.flush()
+        self.db.close()
+        self.db = None
+
+    def _compress(self, data):
+        if self.codec == self.CODEC_ZSTD:
+            return self.__compressor.compress(data)
+        return zlib.compress(data)
+
+    def _decompress(self, codec, data):
+        if codec == self.CODEC_ZSTD:
+            if zstandard is None:
+                return None
+            return self.__decompressor.decompress(data)
+        return zlib.decompress(data)
+
+    def retrieve_response(self, spider, request):
+        fingerprint = self._fingerprint(request)
+        now = time.time()
+        row = self.__pending_writes.get(fingerprint, None)
+        if row is None:
+            row = self.db.execute(
+                "SELECT fingerprint, url, status, headers, body, codec, size, created_at, "
+                "expires_at FROM responses WHERE fingerprint = ?",
+                (fingerprint,),
+            ).fetchone()
+            if row is None:
+                return None
+        url, status, headers, body, codec, _size, created_at, expires_at = row[1:9]
+        if expires_at and expires_at < now:
+            return None
+        body = self._decompress(codec, body)
+        if body is None:
+            return None
+        self.__pending_touches[fingerprint] = now
+        request.meta["cache_timestamp"] = created_at
+        headers = Headers(pickle.loads(headers))
+        respcls = responsetypes.from_args(headers=headers, url=url, body=body)
+        return respcls(url=url, headers=headers, status=status, body=body)
+
+    def store_response(self, spider, request, response):
+        fingerprint = self._fingerprint(request)
+        now = time.time()
+        ttl = request.meta.get("cache_ttl", self.expiration_secs)
+        headers = pickle.dumps(dict(response.headers), protocol=2)
+        body = self._compress(response.body)
+        size = len(body) + len(headers)
+        self.__pending_writes[fingerprint] = (
+            fingerprint,
+            response.url,
+            response.status,
+            headers,
+            body,
+            self.codec,
+            size,
+            now,
+            now + ttl if ttl else None,
+            now,
+        )
+        if len(self.__pending_writes) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """Writes pending entries and access times in single transaction, evicts LRU entries"""
+        if self.db is None or not (self.__pending_writes or self.__pending_touches):
+            return
+        pending_writes, self.__pending_writes = self.__pending_writes, {}
+        pending_touches, self.__pending_touches = self.__pending_touches, {}
+        with self.db:
+            if pending_writes:
+                replaced_size = 0
+                fingerprints = list(pending_writes)
+                for i in range(0, len(fingerprints), 500):
+                    chunk = fingerprints[i : i + 500]
+                    replaced_size += self.db.execute(
+                        "SELECT COALESCE(SUM(size), 0) FROM responses WHERE fingerprint IN "
+                        "({})".format(",".join("?" * len(chunk))),
+                        chunk,
+                    ).fetchone()[0]
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    pending_writes.values(),
+                )
+                self.total_size += sum(row[6] for row in pending_writes.values()) - replaced_size
+            if pending_touches:
+                self.db.executemany(
+                    "UPDATE responses SET accessed_at = ? WHERE fingerprint = ?",
+                    ((accessed_at, fp) for fp, accessed_at in pending_touches.items()),
+                )
+            if self.max_size and self.total_size > self.max_size:
+                self._evict()
+
+    def _evict(self):
+        """Removes expired and then least recently used entries down to 90% of max size"""
+        now = time.time()
+        expired = self.db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses WHERE expires_at < ?", (now,)
+        ).fetchone()[0]
+        self.db.execute("DELETE FROM responses WHERE expires_at < ?", (now,))
+        self.total_size -= expired
+        target_size = int(self.max_size * self._EVICTION_RATIO)
+        evicted_count = 0
+        while self.total_size > target_size:
+            rows = self.db.execute(
+                "SELECT fingerprint, size FROM responses ORDER BY accessed_at LIMIT 500"
+            ).fetchall()
+            if not rows:
+                self.total_size = 0
+                break
+            to_delete = []
+            for fingerprint, size in rows:
+                if self.total_size <= target_size:
+                    break
+                to_delete.append((fingerprint,))
+                self.total_size -= size
+            self.db.executemany("DELETE FROM responses WHERE fingerprint = ?", to_delete)
+            evicted_count += len(to_delete)
+        logger.debug(f"HTTP cache evicted {evicted_count} entries, {self.total_size} bytes left")
@@ -1,3 +1,5 @@
 # -*- coding: utf-8 -*-
 from .logger_mixin import LoggerMixin
 from .mysql_connection_string import mysql_connection_string
+from .proxy_pool import Proxy, ProxyPool
+from .slot_health import SlotHealth
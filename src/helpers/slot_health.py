@@ -0,0 +1,15 @@
+# -*- coding: utf-8 -*-
+import time
+
+
+class SlotHealth:
+    """Moving averages of downloader slot latency and hardware errors rate"""
+
+    __slots__ = ("latency", "baseline_latency", "error_rate", "samples", "updated_at")
+
+    def __init__(self):
+        self.latency = None
+        self.baseline_latency = None
+        self.error_rate = 0.0
+        self.samples = 0
+        self.updated_at = time.monotonic()
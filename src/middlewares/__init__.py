@@ -1,2 +1,3 @@
 # -*- coding: utf-8 -*-
+from .adaptive_throttle_middleware import AdaptiveThrottleMiddleware
 from .http_proxy_middleware import HttpProxyMiddleware
@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import time
+from urllib.parse import urlsplit
+
+from scrapy import Request, Spider
+from scrapy.exceptions import NotConfigured
+from scrapy.http import Response
+
+from helpers import SlotHealth
+from rmq.utils import is_hardware_error, is_hardware_error_status
+
+
+class AdaptiveThrottleMiddleware:
+    """Downloader slots are keyed by proxy and domain, so every proxy/target pair is throttled
+    separately. Must be installed above proxy middleware, to key slot by proxy assigned to
+    current attempt, and above RetryMiddleware (550), to sample every attempt (e.g. at 760).
+
+    Once per slot concurrency samples (round trip) slot is adjusted from moving averages of its
+    latency and of hardware errors rate (failures classified as task HARDWARE_ERROR). Degrading
+    slot halves concurrency and then doubles delay, healthy slot drops delay to DOWNLOAD_DELAY
+    and then grows concurrency up to CONCURRENT_REQUESTS_PER_DOMAIN. Health of slots collected by
+    downloader or idle for IDLE_TTL seconds is forgotten
+    """
+
+    SLOT_META_KEY = "download_slot"
+    OWN_SLOT_META_KEY = "adaptive_throttle_slot"
+    IDLE_TTL = 600.0
+    PRUNE_INTERVAL = 60.0
+
+    def __init__(self, crawler):
+        settings = crawler.settings
+        if not settings.getbool("ADAPTIVE_THROTTLE_ENABLED"):
+            raise NotConfigured
+        self.crawler = crawler
+        self.min_delay = settings.getfloat("DOWNLOAD_DELAY", 0.0)
+        self.max_delay = settings.getfloat("ADAPTIVE_THROTTLE_MAX_DELAY", 60.0)
+        self.max_concurrency = max(1, settings.getint("CONCURRENT_REQUESTS_PER_DOMAIN", 8))
+        self.error_threshold = settings.getfloat("ADAPTIVE_THROTTLE_ERROR_THRESHOLD", 0.2)
+        self.latency_tolerance = settings.getfloat("ADAPTIVE_THROTTLE_LATENCY_TOLERANCE", 2.0)
+        self.smoothing = 0.3
+        self.__health = {}
+        self.__pruned_at = time.monotonic()
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        return cls(crawler)
+
+    @staticmethod
+    def get_slot_key(request: Request) -> str:
+        domain = urlsplit(request.url).hostname or ""
+        proxy = request.meta.get("proxy", None)
+        return "{}|{}".format(proxy, domain) if proxy else domain
+
+    def process_request(self, request: Request, spider: Spider) -> None:
+        meta = request.meta
+        slot_key = meta.get(self.SLOT_META_KEY, None)
+        # Slot set by downloader or by this middleware for previous attempt is recomputed, as
+        # proxy may be changed, slot set explicitly by spider is kept
+        if slot_key is None or slot_key == meta.get(self.OWN_SLOT_META_KEY, None):
+            slot_key = self.get_slot_key(request)
+            meta[self.SLOT_META_KEY] = slot_key
+            meta[self.OWN_SLOT_META_KEY] = slot_key
+
+    def process_response(self, request: Request, response: Response, spider: Spider) -> Response:
+        latency = request.meta.get("download_latency", None)
+        self._record(request, spider, latency, is_hardware_error_status(response.status))
+        return response
+
+    def process_exception(self, request: Request, exception: Exception, spider: Spider) -> None:
+        self._record(request, spider, None, is_hardware_error(exception))
+
+    def _smooth(self, current, value):
+        return value if current is None else current + self.smoothing * (value - current)
+
+    def _prune(self, slots, now: float):
+        idle_since = now - self.IDLE_TTL
+        for key in [
+            key
+            for key, health in self.__health.items()
+            if key not in slots or health.updated_at < idle_since
+        ]:
+            del self.__health[key]
+
+    def _record(self, request: Request, spider: Spider, latency, is_error: bool):
+        key = request.meta.get(self.SLOT_META_KEY, None)
+        slots = self.crawler.engine.downloader.slots
+        now = time.monotonic()
+        if now - self.__pruned_at >= self.PRUNE_INTERVAL:
+            self.__pruned_at = now
+            self._prune(slots, now)
+        slot = slots.get(key, None)
+        if slot is None:
+            # Slot is collected by downloader as inactive
+            self.__health.pop(key, None)
+            return
+        health = self.__health.get(key, None)
+        if health is None:
+            health = self.__health[key] = SlotHealth()
+        health.updated_at = now
+        if latency is not None:
+            health.latency = self._smooth(health.latency, latency)
+            if health.baseline_latency is None or health.latency < health.baseline_latency:
+                health.baseline_latency = health.latency
+        health.error_rate = self._smooth(health.error_rate, 1.0 if is_error else 0.0)
+        health.samples += 1
+        if health.samples < slot.concurrency:
+            return
+        health.samples = 0
+        self._adjust(slot, health, spider)
+
+    def _adjust(self, slot, health: SlotHealth, spider: Spider):
+        is_degrading = health.error_rate > self.error_threshold or (
+            health.latency is not None
+            and health.latency > health.baseline_latency * self.latency_tolerance
+        )
+        stats = self.crawler.stats
+        if is_degrading:
+            stats.inc_value("adaptive_throttle/backoff_count", spider=spider)
+            if slot.concurrency > 1:
+                slot.concurrency = max(1, slot.concurrency // 2)
+            else:
+                slot.delay = min(self.max_delay, max(slot.delay * 2, health.latency or 1.0))
+            # Latency baseline is re-learned at lower load
+            health.baseline_latency = health.latency
+        elif slot.delay > self.min_delay:
+            slot.delay = max(self.min_delay, slot.delay / 2)
+            if slot.delay < 0.05:
+                slot.delay = self.min_delay
+        elif slot.concurrency < self.max_concurrency:
+            stats.inc_value("adaptive_throttle/increase_count", spider=spider)
+            slot.concurrency += 1
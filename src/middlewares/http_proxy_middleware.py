@@ -1,21 +1,44 @@
 # -*- coding: utf-8 -*-
-from scrapy import Request, Spider
-from w3lib.http import basic_auth_header
+from scrapy import Request, Spider, signals
+from scrapy.core.downloader.handlers.http11 import TunnelError
+from scrapy.http import Response
+
+from helpers import ProxyPool
+
+PROXY_META_KEY = "proxy_pool_url"
 
 
 class HttpProxyMiddleware:
-    @staticmethod
-    def update_request(request: Request, spider: Spider) -> Request:
-        proxy = spider.settings.get("PROXY")
-        proxy_auth = spider.settings.get("PROXY_AUTH")
-        if proxy:
-            if proxy_auth:
-                request.headers["Proxy-Authorization"] = basic_auth_header(*proxy_auth.split(":"))
-            if "http" not in proxy:
-                proxy = "http://{}".format(proxy)
-            request.meta["proxy"] = proxy
-        else:
+    """Must be installed above RetryMiddleware (550) and RedirectMiddleware (600), e.g. at 750
+    in place of scrapy HttpProxyMiddleware, to see response or exception of every attempt
+    """
+
+    def __init__(self, crawler):
+        self.stats = crawler.stats
+        self.pool = ProxyPool.from_settings(crawler.settings)
+        self.ban_codes = set(int(code) for code in crawler.settings.getlist("PROXY_BAN_CODES"))
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        o = cls(crawler)
+        crawler.signals.connect(o.spider_closed, signal=signals.spider_closed)
+        return o
+
+    def update_request(self, request: Request, spider: Spider) -> Request:
+        stale_proxy = self.pool.get(request.meta.pop(PROXY_META_KEY, None))
+        if stale_proxy is not None:
+            # Request is sent again before its previous attempt reached process_response
+            self.pool.cancel(stale_proxy)
+        proxy = self.pool.acquire()
+        if proxy is None:
             raise RuntimeError("Proxy url is empty! Proxy is not working!")
+        if proxy.auth_header is not None:
+            request.headers["Proxy-Authorization"] = proxy.auth_header
+        else:
+            # Retried request may keep header of previously used proxy
+            request.headers.pop("Proxy-Authorization", None)
+        request.meta["proxy"] = proxy.url
+        request.meta[PROXY_META_KEY] = proxy.url
         return request
 
     def process_request(self, request: Request, spider: Spider) -> None:
@@ -23,6 +46,35 @@ class HttpProxyMiddleware:
             if not spider.proxy_enabled:
                 return
             else:
-                request = HttpProxyMiddleware.update_request(request, spider)
+                request = self.update_request(request, spider)
         elif spider.settings.get("PROXY_ENABLED"):
-            request = HttpProxyMiddleware.update_request(request, spider)
+            request = self.update_request(request, spider)
+
+    def _release(self, request: Request, spider: Spider, is_error: bool, ban: bool):
+        proxy = self.pool.get(request.meta.pop(PROXY_META_KEY, None))
+        if proxy is None:
+            return
+        self.pool.release(proxy, request.meta.get("download_latency"), is_error, ban)
+        self.stats.inc_value("proxy_pool/{}/requests".format(proxy.url), spider=spider)
+        if is_error:
+            self.stats.inc_value("proxy_pool/{}/errors".format(proxy.url), spider=spider)
+        if ban:
+            self.stats.inc_value("proxy_pool/{}/bans".format(proxy.url), spider=spider)
+
+    def process_response(self, request: Request, response: Response, spider: Spider) -> Response:
+        ban = response.status in self.ban_codes
+        self._release(request, spider, is_error=ban or response.status >= 500, ban=ban)
+        return response
+
+    def process_exception(self, request: Request, exception: Exception, spider: Spider) -> None:
+        self._release(request, spider, is_error=True, ban=isinstance(exception, TunnelError))
+
+    def spider_closed(self, spider: Spider):
+        for url, proxy_stats in self.pool.get_stats().items():
+            if proxy_stats["latency"] is not None:
+                self.stats.set_value(
+                    "proxy_pool/{}/latency".format(url), proxy_stats["latency"], spider=spider
+                )
+            self.stats.set_value(
+                "proxy_pool/{}/error_rate".format(url), proxy_stats["error_rate"], spider=spider
+            )
@@ -1,2 +1,3 @@
 from .consumer import Consumer
+from .dead_letter_replay import DeadLetterReplay
 from .producer import Producer
@@ -1,6 +1,8 @@
 import functools
 import json
 import logging
+import time
+from collections import deque
 from enum import Enum
 from optparse import OptionValueError
 
@@ -14,11 +16,18 @@ from sqlalchemy import select, update
 from sqlalchemy.dialects import mysql
 from sqlalchemy.sql.base import Executable as SQLAlchemyExecutable
 from twisted.enterprise import adbapi
-from twisted.internet import reactor
+from twisted.internet import defer, reactor, task, threads
 
 from database.models.search import SearchEngineQuery
 from rmq.connections import PikaSelectConnection
-from rmq.utils import RMQConstants, RMQDefaultOptions
+from rmq.sinks import JsonLinesSink, ParquetSink
+from rmq.utils import (
+    MessageDeduplicator,
+    PrefetchAutoTuner,
+    RMQConstants,
+    RMQDefaultOptions,
+    get_queue_options,
+)
 from rmq.utils.decorators import call_once
 
 
@@ -28,8 +37,17 @@ class Consumer(ScrapyCommand):
         WORKER = "worker"
         DEFAULT = ACTION
 
+    class SinkTypes(Enum):
+        JSONL = "jsonl"
+        PARQUET = "parquet"
+
     _DEFAULT_CHECK_INTERACT_READY_DELAY = 3  # seconds
-    _DEFAULT_PREFETCH_COUNT = 4
+    _DEFAULT_DB_POOL_MIN = 3
+    _DEFAULT_DB_POOL_MAX = 5
+    _DEFAULT_AUTOTUNE_INTERVAL = 10  # seconds
+    _DEFAULT_SINK_BATCH_SIZE = 10000
+    _DEFAULT_SINK_FLUSH_INTERVAL = 60  # seconds
+    _SINK_FLUSH_CHECK_DELAY = 1  # seconds
 
     def __init__(self):
         super().__init__()
@@ -41,10 +59,25 @@ class Consumer(ScrapyCommand):
             Consumer.CommandModes.WORKER.value,
         ]
         self.mode = Consumer.CommandModes.DEFAULT.value
-        self.prefetch_count = self._DEFAULT_PREFETCH_COUNT
+        self.db_pool_min = self._DEFAULT_DB_POOL_MIN
+        self.db_pool_max = self._DEFAULT_DB_POOL_MAX
+        self.max_in_flight = self._DEFAULT_DB_POOL_MAX
+        self.prefetch_count = self._DEFAULT_DB_POOL_MAX
+        self.prefetch_auto_tuner = None
+        self._auto_tune_task = None
+
+        self.in_flight_count = 0
+        self.pending_messages = deque()
+
+        self.sink = None
+        self.sink_lock = defer.DeferredLock()
+        self.sink_messages = []
+        self.sink_message_keys = []
+        self._sink_flush_task = None
 
         self.delivery_tag_meta_key = RMQConstants.DELIVERY_TAG_META_KEY.value
         self.msg_body_meta_key = RMQConstants.MSG_BODY_META_KEY.value
+        self.sub_task_meta_key = RMQConstants.SUB_TASK_META_KEY.value
 
         self.queue_name = None
 
@@ -53,6 +86,7 @@ class Consumer(ScrapyCommand):
         self._can_get_next_message = False
 
         self.db_connection_pool = None
+        self.deduplicator = None
 
         self.check_interact_ready_delay = Consumer._DEFAULT_CHECK_INTERACT_READY_DELAY
 
@@ -90,6 +124,49 @@ class Consumer(ScrapyCommand):
             dest="prefetch_count",
             help="RabbitMQ consumer prefetch count setting",
         )
+        parser.add_option(
+            "--db_pool_min",
+            type="int",
+            default=None,
+            dest="db_pool_min",
+            help="minimal number of connections in database connection pool",
+        )
+        parser.add_option(
+            "--db_pool_max",
+            type="int",
+            default=None,
+            dest="db_pool_max",
+            help="maximal number of connections in database connection pool",
+        )
+        parser.add_option(
+            "--max_in_flight",
+            type="int",
+            default=None,
+            dest="max_in_flight",
+            help="maximal number of messages processed by database at the same time",
+        )
+        parser.add_option(
+            "--sink",
+            type="choice",
+            choices=[sink_type.value for sink_type in Consumer.SinkTypes],
+            default=None,
+            dest="sink",
+            help="write messages to compressed files in batches instead of database",
+        )
+        parser.add_option(
+            "--sink_path",
+            type="str",
+            default=None,
+            dest="sink_path",
+            help="directory for sink files",
+        )
+        parser.add_option(
+            "--autotune",
+            action="store_true",
+            default=None,
+            dest="autotune",
+            help="adjust prefetch count according to database latency (worker mode only)",
+        )
 
     def queue_option_callback(self, _option, opt, value, parser):
         if value is not None and len(str(value).strip()):
@@ -109,17 +186,86 @@ class Consumer(ScrapyCommand):
         self.queue_name = queue_name
         return queue_name
 
+    def _get_positive_int(self, opts, option_name, setting_name, default):
+        value = getattr(opts, option_name, None)
+        if value is None or value < 1:
+            value = self.project_settings.getint(setting_name, 0)
+        if value is None or value < 1:
+            value = default
+        return int(value)
+
+    def init_concurrency(self, opts):
+        """Database pool size, in-flight messages limit and prefetch count are independent settings.
+        Not provided in-flight limit equals to pool max size, not provided prefetch count equals to in-flight limit
+        """
+        self.db_pool_max = self._get_positive_int(
+            opts, "db_pool_max", "CONSUMER_DB_POOL_MAX", self._DEFAULT_DB_POOL_MAX
+        )
+        self.db_pool_min = min(
+            self._get_positive_int(
+                opts, "db_pool_min", "CONSUMER_DB_POOL_MIN", self._DEFAULT_DB_POOL_MIN
+            ),
+            self.db_pool_max,
+        )
+        self.max_in_flight = self._get_positive_int(
+            opts, "max_in_flight", "CONSUMER_MAX_IN_FLIGHT", self.db_pool_max
+        )
+        self.init_prefetch_count(opts)
+
     def init_prefetch_count(self, opts):
         mode = getattr(opts, "mode", None)
         if mode == Consumer.CommandModes.ACTION.value:
+            self.max_in_flight = 1
             self.prefetch_count = 1
-        thread_pool = reactor.getThreadPool()
-        if thread_pool and hasattr(thread_pool, "max"):
-            self.prefetch_count = int(thread_pool.max - (thread_pool.max % 4))
-        if opts.prefetch_count is not None and opts.prefetch_count > 0:
-            self.prefetch_count = opts.prefetch_count
+            return self.prefetch_count
+        self.prefetch_count = self._get_positive_int(
+            opts,
+            "prefetch_count",
+            "CONSUMER_PREFETCH_COUNT",
+            self.sink.batch_size if self.sink is not None else self.max_in_flight,
+        )
+        autotune = getattr(opts, "autotune", None)
+        if autotune is None:
+            autotune = self.project_settings.getbool("CONSUMER_PREFETCH_AUTOTUNE", False)
+        if autotune:
+            self.prefetch_auto_tuner = PrefetchAutoTuner(
+                self.prefetch_count,
+                min_prefetch_count=self.max_in_flight,
+                max_prefetch_count=self.project_settings.getint(
+                    "CONSUMER_PREFETCH_AUTOTUNE_MAX", self.max_in_flight * 20
+                ),
+            )
         return self.prefetch_count
 
+    def init_sink(self, opts):
+        sink_type = getattr(opts, "sink", None) or self.project_settings.get("CONSUMER_SINK")
+        if not sink_type:
+            return None
+        sink_path = getattr(opts, "sink_path", None) or self.project_settings.get(
+            "CONSUMER_SINK_PATH"
+        )
+        if not sink_path:
+            raise NotImplementedError("sink path must be provided with options or settings")
+        self.sink = self.build_sink(Consumer.SinkTypes(sink_type), sink_path)
+        return self.sink
+
+    def build_sink(self, sink_type, sink_path):
+        """Override to use custom sink or sink options"""
+        sink_class = {
+            Consumer.SinkTypes.JSONL: JsonLinesSink,
+            Consumer.SinkTypes.PARQUET: ParquetSink,
+        }[sink_type]
+        return sink_class(
+            sink_path,
+            file_prefix=self.queue_name,
+            batch_size=self.project_settings.getint(
+                "CONSUMER_SINK_BATCH_SIZE", self._DEFAULT_SINK_BATCH_SIZE
+            ),
+            flush_interval=self.project_settings.getint(
+                "CONSUMER_SINK_FLUSH_INTERVAL", self._DEFAULT_SINK_FLUSH_INTERVAL
+            ),
+        )
+
     def init_db_connection_pool(self):
         """In case of using non mysql database or if pymysql is preferred this method must be overridden
         Also self.process_message method must be overridden in case of replacing database engine
@@ -134,14 +280,26 @@ class Consumer(ScrapyCommand):
             charset="utf8mb4",
             use_unicode=True,
             cursorclass=DictCursor,
+            cp_min=self.db_pool_min,
+            cp_max=self.db_pool_max,
         )
 
     def execute(self, _args, opts):
         self.init_queue_name(opts)
-        self.init_prefetch_count(opts)
+        self.init_sink(opts)
+        self.init_concurrency(opts)
         self.mode = opts.mode
 
-        self.init_db_connection_pool()
+        if self.sink is None:
+            self.init_db_connection_pool()
+        else:
+            self._sink_flush_task = task.LoopingCall(self.check_sink_flush_required)
+            self._sink_flush_task.start(self._SINK_FLUSH_CHECK_DELAY, now=False)
+            reactor.addSystemEventTrigger("before", "shutdown", self.close_sink)
+        self.deduplicator = MessageDeduplicator.from_settings(self.project_settings)
+        if self.deduplicator is not None:
+            # Thread pool is stopped by then, so pending store writes are finished
+            reactor.addSystemEventTrigger("after", "shutdown", self.deduplicator.close)
 
         parameters = pika.ConnectionParameters(
             host=self.project_settings.get("RABBITMQ_HOST"),
@@ -155,6 +313,37 @@ class Consumer(ScrapyCommand):
         )
         reactor.callInThread(self.connect, parameters, self.queue_name)
 
+        if self.prefetch_auto_tuner is not None:
+            self._auto_tune_task = task.LoopingCall(self.auto_tune_prefetch_count)
+            self._auto_tune_task.start(
+                self.project_settings.getint(
+                    "CONSUMER_PREFETCH_AUTOTUNE_INTERVAL", self._DEFAULT_AUTOTUNE_INTERVAL
+                ),
+                now=False,
+            )
+
+    def auto_tune_prefetch_count(self):
+        if not self._can_interact:
+            return
+        prefetch_count = self.prefetch_auto_tuner.adjust()
+        if prefetch_count is None:
+            return
+        self.rmq_connection.connection.ioloop.add_callback_threadsafe(
+            functools.partial(self._update_prefetch_count, prefetch_count)
+        )
+
+    def _update_prefetch_count(self, prefetch_count):
+        """Runs in ioloop thread, tuner is updated in reactor thread once prefetch is applied"""
+        self.rmq_connection.update_prefetch_count(
+            prefetch_count,
+            callback=functools.partial(reactor.callFromThread, self.on_prefetch_count_updated),
+        )
+
+    def on_prefetch_count_updated(self, prefetch_count):
+        self.logger.info(f"prefetch count changed to {prefetch_count}")
+        self.prefetch_count = prefetch_count
+        self.prefetch_auto_tuner.commit(prefetch_count)
+
     def on_basic_get_message(self, message):
         delivery_tag = message.get("method").delivery_tag
         ack_cb = nack_cb = None
@@ -171,22 +360,111 @@ class Consumer(ScrapyCommand):
                 functools.partial(
                     self.rmq_connection.connection.ioloop.add_callback_threadsafe,
                     functools.partial(
-                        self.rmq_connection.negative_acknowledge_message, delivery_tag=delivery_tag
+                        self.rmq_connection.reject_message,
+                        delivery_tag=delivery_tag,
+                        body=message.get("body"),
+                        properties=message.get("properties"),
                     ),
                 )
             )
 
-        message_body = json.loads(message["body"])
+        if self.deduplicator is None:
+            self.process_consumed_message(message, ack_cb, nack_cb)
+            return
+        message_key = self.deduplicator.get_message_key(message)
+        # Lookup of redelivered message in persistent store takes in-flight slot
+        self.in_flight_count += 1
+        d = self.deduplicator.is_processed(message_key, message.get("method").redelivered)
+        d.addErrback(self.on_dedup_lookup_failure)
+        d.addCallback(self.on_dedup_lookup, message, ack_cb, nack_cb, message_key)
+
+    def on_dedup_lookup(self, is_processed, message, ack_cb, nack_cb, message_key):
+        if is_processed:
+            self.logger.info(
+                f"message {message_key} is already processed, acking. "
+                f"Dedup hit ratio: {self.deduplicator.hit_ratio():.4f}"
+            )
+            if callable(ack_cb):
+                ack_cb()
+            self._can_get_next_message = True
+            self._on_message_done(None)
+            self._check_mode(None)
+            return
+        self.in_flight_count -= 1
+        self.process_consumed_message(message, ack_cb, nack_cb, message_key)
+        self._process_pending_messages()
+
+    def on_dedup_lookup_failure(self, failure):
+        failure.trap(Exception)
+        self.logger.error("dedup lookup failure: {}".format(failure))
+        return False
+
+    def process_consumed_message(self, message, ack_cb, nack_cb, message_key=None):
+        message_bodies = self.unpack_message(message)
+
+        if self.sink is not None:
+            self.process_sink_message(message_bodies, message, message_key)
+            self._can_get_next_message = True
+            return
 
-        d = self.db_connection_pool.runInteraction(self.process_message, message_body)
+        self.in_flight_count += 1
+        d = self.db_connection_pool.runInteraction(
+            self._timed_process_message, message_bodies, message.get("received_at", time.time())
+        )
         d.addCallback(
-            self.on_message_processed, ack_callback=ack_cb, nack_callback=nack_cb,
+            self.on_message_processed,
+            ack_callback=ack_cb,
+            nack_callback=nack_cb,
+            message_key=message_key,
         ).addErrback(self.on_message_process_failure, nack_callback=nack_cb).addBoth(
-            self._check_mode
-        )
+            self._on_message_done
+        ).addBoth(self._check_mode)
 
         self._can_get_next_message = True
 
+    @staticmethod
+    def unpack_message(message):
+        """Returns list of message bodies. Replies batched by RPCTaskConsumer (see
+        RMQ_REPLY_BATCH_SIZE) are published as JSON array with batch size header"""
+        message_body = json.loads(message["body"])
+        headers = getattr(message.get("properties"), "headers", None) or {}
+        if RMQConstants.REPLY_BATCH_SIZE_HEADER.value in headers and isinstance(
+            message_body, list
+        ):
+            return message_body
+        return [message_body]
+
+    def _timed_process_message(self, transaction, message_bodies, received_at):
+        started_at = time.time()
+        result = self.process_messages(transaction, message_bodies)
+        if self.prefetch_auto_tuner is not None:
+            reactor.callFromThread(
+                self.prefetch_auto_tuner.record, started_at - received_at, time.time() - started_at
+            )
+        return result
+
+    def process_messages(self, transaction, message_bodies):
+        """Processes all bodies of consumed message (batch of replies) in single transaction.
+        Could be overridden to store batch with single multi-row statement.
+        Message is acked only if every body is processed successfully
+        """
+        for message_body in message_bodies:
+            if self.is_sub_task_reply(message_body):
+                is_processed = self.process_sub_task_reply(transaction, message_body)
+            else:
+                is_processed = self.process_message(transaction, message_body)
+            if not is_processed:
+                return False
+        return True
+
+    def is_sub_task_reply(self, message_body):
+        """Sub-task replies of fan-out tasks (see RMQ_SUB_TASK_REPLIES) are marked with index"""
+        return isinstance(message_body, dict) and self.sub_task_meta_key in message_body
+
+    def process_sub_task_reply(self, transaction, message_body):
+        """Sub-task replies are skipped by default, could be overridden to store them"""
+        return True
+
     def process_message(self, transaction, message_body):
         """If processing message task requires several queries to db or single query has extreme difficulty
         then this method could be overridden.
@@ -224,8 +502,12 @@ class Consumer(ScrapyCommand):
         """
         raise NotImplementedError
 
-    def on_message_processed(self, message_store_result, ack_callback=None, nack_callback=None):
+    def on_message_processed(
+        self, message_store_result, ack_callback=None, nack_callback=None, message_key=None
+    ):
         if message_store_result:
+            if self.deduplicator is not None:
+                self.deduplicator.mark_processed(message_key)
             if callable(ack_callback):
                 ack_callback()
         else:
@@ -247,12 +529,102 @@ class Consumer(ScrapyCommand):
                 )
                 reactor.callLater(0, self.crawler_process._graceful_stop_reactor)
 
+    def build_sink_row(self, message_body):
+        """Override to transform message into row written by sink"""
+        return message_body
+
+    def process_sink_message(self, message_bodies, message, message_key=None):
+        rows = [
+            self.build_sink_row(message_body)
+            for message_body in message_bodies
+            if not self.is_sub_task_reply(message_body)
+        ]
+        if not rows and self.sink.is_empty():
+            # Nothing to write (e.g. only sub-task replies), message is acked at once
+            message_keys = [message_key] if message_key is not None else []
+            self.on_sink_batch_written(None, [message], message_keys, 0)
+            self._check_mode(None)
+            return
+        for row in rows:
+            self.sink.add(row)
+        self.sink_messages.append(message)
+        if message_key is not None:
+            self.sink_message_keys.append(message_key)
+        if self.mode == Consumer.CommandModes.ACTION.value or self.sink.is_flush_required():
+            self.flush_sink()
+
+    def check_sink_flush_required(self):
+        if self.sink.is_flush_required():
+            self.flush_sink()
+
+    def flush_sink(self):
+        """Batches are written one by one. Only deliveries of written batch are acked: messages
+        delivered before it could still wait for in-flight slot or dedup lookup"""
+        return self.sink_lock.run(self._flush_sink)
+
+    def _flush_sink(self):
+        if self.sink.is_empty():
+            return None
+        columns, rows_count = self.sink.take_batch()
+        messages, message_keys = self.sink_messages, self.sink_message_keys
+        self.sink_messages, self.sink_message_keys = [], []
+        d = threads.deferToThread(self.sink.write_batch, columns, rows_count)
+        d.addCallback(self.on_sink_batch_written, messages, message_keys, rows_count)
+        d.addErrback(self.on_sink_batch_failure, messages).addBoth(self._check_mode)
+        return d
+
+    def on_sink_batch_written(self, _result, messages, message_keys, rows_count):
+        self.logger.debug(f"{rows_count} rows written by sink")
+        if self.deduplicator is not None:
+            for message_key in message_keys:
+                self.deduplicator.mark_processed(message_key)
+        self.rmq_connection.connection.ioloop.add_callback_threadsafe(
+            functools.partial(
+                self.rmq_connection.acknowledge_messages,
+                [message.get("method").delivery_tag for message in messages],
+            )
+        )
+
+    def on_sink_batch_failure(self, failure, messages):
+        failure.trap(Exception)
+        self.logger.error("sink failure: {}".format(failure))
+        self.rmq_connection.connection.ioloop.add_callback_threadsafe(
+            functools.partial(self._reject_messages, messages)
+        )
+
+    def _reject_messages(self, messages):
+        for message in messages:
+            self.rmq_connection.reject_message(
+                delivery_tag=message.get("method").delivery_tag,
+                body=message.get("body"),
+                properties=message.get("properties"),
+            )
+
+    def close_sink(self):
+        """Not flushed rows are left unacked and will be redelivered"""
+        if self._sink_flush_task is not None and self._sink_flush_task.running:
+            self._sink_flush_task.stop()
+        return self.sink_lock.run(threads.deferToThread, self.sink.close)
+
+    def _on_message_done(self, arg):
+        self.in_flight_count -= 1
+        self._process_pending_messages()
+        return arg
+
+    def _process_pending_messages(self):
+        while self.pending_messages and self.in_flight_count < self.max_in_flight:
+            self.on_basic_get_message(self.pending_messages.popleft())
+
     def _check_mode(self, arg):
         if self.mode == Consumer.CommandModes.ACTION.value:
             reactor.callLater(0, self.crawler_process._graceful_stop_reactor)
         return arg
 
     def on_message_consumed(self, message):
+        message["received_at"] = time.time()
+        if self.in_flight_count >= self.max_in_flight:
+            self.pending_messages.append(message)
+            return
         self.on_basic_get_message(message)
 
     def on_basic_get_empty(self):
@@ -276,6 +648,7 @@ class Consumer(ScrapyCommand):
             options={
                 "enable_delivery_confirmations": False,
                 "prefetch_count": self.prefetch_count,
+                **get_queue_options(self.project_settings),
             },
             is_consumer=True,
         )
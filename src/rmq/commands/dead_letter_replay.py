@@ -0,0 +1,174 @@
+import functools
+import logging
+from optparse import OptionValueError
+
+import pika
+from scrapy.commands import ScrapyCommand
+from scrapy.utils.log import configure_logging
+from scrapy.utils.project import get_project_settings
+from twisted.internet import reactor
+
+from rmq.connections import PikaSelectConnection
+from rmq.utils import RMQConstants, RMQDefaultOptions
+
+
+class DeadLetterReplay(ScrapyCommand):
+    """Moves messages parked in dead letter queue (<queue>.dlq) back to the work queue.
+    Attempts counter of replayed messages is reset"""
+
+    _DEFAULT_CHUNK_SIZE = 500
+
+    def __init__(self):
+        super().__init__()
+        self.project_settings = get_project_settings()
+        self.logger = logging.getLogger(DeadLetterReplay.__class__.__name__)
+
+        self.queue_name = None
+        self.chunk_size = DeadLetterReplay._DEFAULT_CHUNK_SIZE
+        self.limit = 0
+
+        self.rmq_connection = None
+        self._can_interact = False
+        self._is_count_requested = False
+        self._is_done = False
+
+        self.messages_to_replay = None
+        self.replayed_count = 0
+
+    def set_logger(self, name: str = "COMMAND", level: str = "DEBUG"):
+        self.logger = logging.getLogger(name=name)
+        self.logger.setLevel(level)
+        configure_logging()
+        logging.getLogger("pika").setLevel(self.project_settings.get("PIKA_LOG_LEVEL", "WARNING"))
+
+    def add_options(self, parser):
+        ScrapyCommand.add_options(self, parser)
+        parser.add_option(
+            "-q",
+            "--queue",
+            type="str",
+            dest="queue_name",
+            help="Work queue name which dead letter queue must be replayed",
+            action="callback",
+            callback=self.queue_option_callback,
+        )
+        parser.add_option(
+            "-c",
+            "--chunk_size",
+            type="int",
+            default=DeadLetterReplay._DEFAULT_CHUNK_SIZE,
+            dest="chunk_size",
+            help="number of messages to be moved at once (prefetch count)",
+        )
+        parser.add_option(
+            "-l",
+            "--limit",
+            type="int",
+            default=0,
+            dest="limit",
+            help="maximal number of messages to replay, all currently dead lettered by default",
+        )
+
+    def queue_option_callback(self, _option, opt, value, parser):
+        if value is not None and len(str(value).strip()):
+            self.queue_name = value
+            setattr(parser.values, "queue_name", value)
+        else:
+            raise OptionValueError(f"Option {opt} has incorrect value provided")
+
+    def init_queue_name(self, opts):
+        queue_name = getattr(opts, "queue_name", None)
+        if queue_name is None:
+            queue_name = self.queue_name
+        if queue_name is None:
+            raise NotImplementedError(
+                "queue name must be provided with options or override this method to return it"
+            )
+        self.queue_name = queue_name
+        return queue_name
+
+    def execute(self, _args, opts):
+        self.init_queue_name(opts)
+        self.chunk_size = max(1, opts.chunk_size)
+        self.limit = max(0, opts.limit)
+
+        parameters = pika.ConnectionParameters(
+            host=self.project_settings.get("RABBITMQ_HOST"),
+            port=int(self.project_settings.get("RABBITMQ_PORT")),
+            virtual_host=self.project_settings.get("RABBITMQ_VHOST"),
+            credentials=pika.credentials.PlainCredentials(
+                username=self.project_settings.get("RABBITMQ_USERNAME"),
+                password=self.project_settings.get("RABBITMQ_PASSWORD"),
+            ),
+            heartbeat=RMQDefaultOptions.CONNECTION_HEARTBEAT.value,
+        )
+        dead_letter_queue_name = PikaSelectConnection.get_dead_letter_queue_name(self.queue_name)
+        reactor.callInThread(self.connect, parameters, dead_letter_queue_name)
+
+    def on_ready_messages_count(self, message_count=None):
+        self.messages_to_replay = message_count or 0
+        if self.limit:
+            self.messages_to_replay = min(self.messages_to_replay, self.limit)
+        self.logger.info(f"{self.messages_to_replay} messages will be replayed")
+        self._check_is_done()
+        if not self._is_done:
+            self.rmq_connection.connection.ioloop.add_callback_threadsafe(
+                self.rmq_connection.start_consuming
+            )
+
+    def on_message_consumed(self, message):
+        if self.replayed_count >= self.messages_to_replay:
+            """Message is left unacked and returns to dead letter queue on connection close"""
+            return
+        self.replayed_count += 1
+        properties = message["properties"]
+        headers = dict(properties.headers or {})
+        headers.pop(RMQConstants.ATTEMPTS_HEADER.value, None)
+        headers.pop("x-death", None)
+        properties.headers = headers
+        cb = functools.partial(
+            self.rmq_connection.republish_message,
+            delivery_tag=message["method"].delivery_tag,
+            body=message["body"],
+            properties=properties,
+            queue_name=self.queue_name,
+        )
+        self.rmq_connection.connection.ioloop.add_callback_threadsafe(cb)
+        self._check_is_done()
+
+    def _check_is_done(self):
+        if self._is_done:
+            return
+        if self.messages_to_replay is not None and self.replayed_count >= self.messages_to_replay:
+            self._is_done = True
+            self.logger.info(f"{self.replayed_count} messages replayed")
+            self.rmq_connection.connection.ioloop.add_callback_threadsafe(self.rmq_connection.stop)
+            reactor.callLater(0, self.crawler_process._graceful_stop_reactor)
+
+    def set_connection_handle(self, connection):
+        self.rmq_connection = connection
+
+    def set_can_interact(self, can_interact):
+        self._can_interact = can_interact
+        if can_interact and not self._is_count_requested:
+            self._is_count_requested = True
+            cb = functools.partial(
+                self.rmq_connection.get_ready_messages_count,
+                callback=functools.partial(reactor.callFromThread, self.on_ready_messages_count),
+            )
+            self.rmq_connection.connection.ioloop.add_callback_threadsafe(cb)
+
+    def connect(self, parameters, queue_name):
+        c = PikaSelectConnection(
+            parameters,
+            queue_name,
+            owner=self,
+            options={"enable_delivery_confirmations": False, "prefetch_count": self.chunk_size},
+            is_consumer=False,
+        )
+        c.run()
+
+    def run(self, args, opts):
+        self.set_logger(self.__class__.__name__, self.project_settings.get("LOG_LEVEL"))
+        reactor.callLater(0, self.execute, args, opts)
+        reactor.run()
@@ -16,7 +16,7 @@ from twisted.enterprise import adbapi
 from twisted.internet import reactor
 
 from rmq.connections import PikaSelectConnection
-from rmq.utils import RMQConstants, RMQDefaultOptions, TaskStatusCodes
+from rmq.utils import RMQConstants, RMQDefaultOptions, TaskStatusCodes, get_queue_options
 
 
 class Producer(ScrapyCommand):
@@ -45,6 +45,8 @@ class Producer(ScrapyCommand):
 
         self.task_queue_name = None
         self.reply_to_queue_name = None
+        self.priority_column = None
+        self.max_priority = 0
 
         self.rmq_connection = None
         self._can_interact = False
@@ -96,6 +98,15 @@ class Producer(ScrapyCommand):
             dest="chunk_size",
             help="number of tasks to produce at one iteration",
         )
+        parser.add_option(
+            "-p",
+            "--priority_column",
+            type="str",
+            default=self.project_settings.get("RABBITMQ_PRIORITY_COLUMN", None),
+            dest="priority_column",
+            help="task row column which value is used as message priority "
+            "(requires RABBITMQ_MAX_PRIORITY)",
+        )
 
     def task_queue_option_callback(self, _option, opt, value, parser):
         if value is not None and len(str(value).strip()):
@@ -146,6 +157,10 @@ class Producer(ScrapyCommand):
         self.init_replies_queue_name(opts)
         self.mode = opts.mode
         self.chunk_size = opts.chunk_size
+        self.priority_column = opts.priority_column or None
+        self.max_priority = get_queue_options(self.project_settings).get("max_priority", 0)
+        if self.priority_column is not None and not self.max_priority:
+            self.logger.warning("RABBITMQ_MAX_PRIORITY is not set, message priority is ignored")
 
         self.init_db_connection_pool()
 
@@ -257,6 +272,16 @@ class Producer(ScrapyCommand):
     def build_message_body(self, db_task):
         return dict(db_task)
 
+    def build_message_priority(self, db_task):
+        """Returns AMQP priority of task message or None. By default value of priority column"""
+        if self.priority_column is None or not self.max_priority:
+            return None
+        try:
+            priority = int(db_task[self.priority_column] or 0)
+        except (KeyError, TypeError, ValueError):
+            return None
+        return max(0, min(self.max_priority, priority))
+
     def build_task_update_stmt(self, db_task, status):
         """This method must returns sqlalchemy Executable or string that represents valid raw SQL update query
 
@@ -274,7 +299,7 @@ class Producer(ScrapyCommand):
             rows = [rows]
         for row in rows:
             msg_body = self.build_message_body(row)
-            self._send_message(msg_body)
+            self._send_message(msg_body, self.build_message_priority(row))
             self.db_connection_pool.runInteraction(
                 self.update_task_interaction, row, TaskStatusCodes.IN_QUEUE.value
             )
@@ -283,7 +308,7 @@ class Producer(ScrapyCommand):
         elif self.mode == Producer.CommandModes.WORKER.value:
             reactor.callLater(0, self.produce_tasks)
 
-    def _send_message(self, msg_body):
+    def _send_message(self, msg_body, priority=None):
         if not isinstance(msg_body, dict):
             raise ValueError("Built message body is not a dictionary")
         for key, val in msg_body.items():
@@ -294,7 +319,10 @@ class Producer(ScrapyCommand):
             message=json.dumps(msg_body),
             queue_name=self.task_queue_name,
             properties=pika.BasicProperties(
-                content_type="application/json", delivery_mode=2, reply_to=self.reply_to_queue_name
+                content_type="application/json",
+                delivery_mode=2,
+                reply_to=self.reply_to_queue_name,
+                priority=priority,
             ),
         )
         self.rmq_connection.connection.ioloop.add_callback_threadsafe(cb)
@@ -311,7 +339,11 @@ class Producer(ScrapyCommand):
             parameters,
             queue_name,
             owner=self,
-            options={"enable_delivery_confirmations": True, "prefetch_count": 1,},
+            options={
+                "enable_delivery_confirmations": True,
+                "prefetch_count": 1,
+                **get_queue_options(self.project_settings),
+            },
             is_consumer=False,
         )
         c.run()
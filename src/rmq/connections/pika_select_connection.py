@@ -7,6 +7,7 @@ import pika
 from pika.exceptions import ChannelWrongStateError, ConnectionWrongStateError
 from twisted.internet import reactor, threads
 
+from rmq.utils import RMQConstants
 from rmq.utils.decorators import log_current_thread
 
 logger = logging.getLogger(__name__)
@@ -40,7 +41,9 @@ class PikaSelectConnection:
 
         # additional options
         self.options = (
-            options if options is not None and isinstance(options, dict) else self._DEFAULT_OPTIONS
+            dict(options)
+            if options is not None and isinstance(options, dict)
+            else dict(self._DEFAULT_OPTIONS)
         )
 
         # is current connection should start consuming on ioloop run state
@@ -64,7 +67,12 @@ class PikaSelectConnection:
         self._nacked = 0
 
         self._consumer_tag = None
+        # consumer tag -> consumed queue name
+        self._consumer_tags = {}
         self._consuming = False
+        # consumer is cancelled on owner request (throttling) and must not be restarted implicitly
+        self._paused = False
+        self._cancel_callback_channel = None
 
         self.__ignore_ack_after = None
 
@@ -185,11 +193,134 @@ class PikaSelectConnection:
     def setup_queue(self, queue_name):
         """If queue require some specific properties at declaration subclass of this class should be created and
         this method should be overridden"""
+        if self.options.get("consume_queues", None):
+            self.setup_consume_queues()
+            return
+        if self.options.get("dead_letter_enabled", False):
+            self.setup_dead_letter_topology(queue_name)
+            return
         logger.info("Declaring queue {}".format(queue_name))
         self._channel.queue_declare(
-            queue=queue_name, callback=self.on_queue_declare_ok, durable=True
+            queue=queue_name,
+            callback=self.on_queue_declare_ok,
+            durable=True,
+            arguments=self.get_queue_arguments() or None,
+        )
+
+    def get_consume_queues(self):
+        """Returns list of (queue name, prefetch count) pairs to be consumed. Multiple queues are
+        consumed over the same channel if "consume_queues" option is provided, prefetch count is
+        applied to each consumer separately"""
+        consume_queues = self.options.get("consume_queues", None)
+        if not consume_queues:
+            return [(self.queue_name, None)]
+        return [(queue_name, prefetch_count) for queue_name, prefetch_count in consume_queues]
+
+    def setup_consume_queues(self):
+        steps = []
+        for queue_name, _prefetch_count in self.get_consume_queues():
+            logger.info("Declaring queue {}".format(queue_name))
+            if self.options.get("dead_letter_enabled", False):
+                steps.extend(self.get_dead_letter_declare_steps(queue_name))
+            else:
+                steps.append(
+                    functools.partial(
+                        self._channel.queue_declare,
+                        queue=queue_name,
+                        durable=True,
+                        arguments=self.get_queue_arguments() or None,
+                    )
+                )
+        self._declare_sequentially(steps, self.on_queue_declare_ok)
+
+    def get_queue_arguments(self):
+        """Arguments of work queue declaration. Note: existing queue can not be redeclared
+        with different arguments, it must be deleted first"""
+        arguments = {}
+        if self.options.get("max_priority", 0):
+            arguments["x-max-priority"] = self.options["max_priority"]
+        return arguments
+
+    def get_dead_letter_arguments(self, queue_name):
+        """Dead letter arguments of work queue declaration, empty if topology is disabled"""
+        if not self.options.get("dead_letter_enabled", False):
+            return {}
+        return {"x-dead-letter-exchange": self.get_dead_letter_exchange_name(queue_name)}
+
+    def get_declare_arguments(self, queue_name):
+        """All arguments work queue is declared with, any redeclaration must pass the same"""
+        return {**self.get_queue_arguments(), **self.get_dead_letter_arguments(queue_name)}
+
+    @staticmethod
+    def get_dead_letter_exchange_name(queue_name):
+        return "{}.dlx".format(queue_name)
+
+    @staticmethod
+    def get_dead_letter_queue_name(queue_name):
+        return "{}.dlq".format(queue_name)
+
+    @staticmethod
+    def get_retry_queue_name(queue_name, delay):
+        return "{}.retry.{}s".format(queue_name, delay)
+
+    def setup_dead_letter_topology(self, queue_name):
+        """Declares dead letter exchange with parking queue (DLQ) and TTL based retry queues,
+        which dead letter expired messages back to the work queue.
+        Note: already existing work queue must be deleted before enabling, as RabbitMQ
+        does not allow to change arguments of declared queue
+        """
+        logger.info("Declaring queue {} with dead letter topology".format(queue_name))
+        self._declare_sequentially(
+            self.get_dead_letter_declare_steps(queue_name), self.on_queue_declare_ok
         )
 
+    def get_dead_letter_declare_steps(self, queue_name):
+        dead_letter_exchange = self.get_dead_letter_exchange_name(queue_name)
+        dead_letter_queue = self.get_dead_letter_queue_name(queue_name)
+        steps = [
+            functools.partial(
+                self._channel.exchange_declare,
+                exchange=dead_letter_exchange,
+                exchange_type="direct",
+                durable=True,
+            ),
+            functools.partial(self._channel.queue_declare, queue=dead_letter_queue, durable=True),
+            functools.partial(
+                self._channel.queue_bind,
+                queue=dead_letter_queue,
+                exchange=dead_letter_exchange,
+                routing_key=queue_name,
+            ),
+        ]
+        for delay in sorted(set(self.options.get("retry_delays", []))):
+            steps.append(
+                functools.partial(
+                    self._channel.queue_declare,
+                    queue=self.get_retry_queue_name(queue_name, delay),
+                    durable=True,
+                    arguments={
+                        "x-message-ttl": int(delay * 1000),
+                        "x-dead-letter-exchange": "",
+                        "x-dead-letter-routing-key": queue_name,
+                    },
+                )
+            )
+        steps.append(
+            functools.partial(
+                self._channel.queue_declare,
+                queue=queue_name,
+                durable=True,
+                arguments=self.get_declare_arguments(queue_name),
+            )
+        )
+        return steps
+
+    def _declare_sequentially(self, steps, callback):
+        if not len(steps):
+            callback(None)
+            return
+        steps[0](callback=lambda _frame: self._declare_sequentially(steps[1:], callback))
+
     def on_queue_declare_ok(self, _unused_frame):
         logger.info("Queue declared")
         self.set_qos()
@@ -201,6 +332,49 @@ class PikaSelectConnection:
             callback=self.start_interacting,
         )
 
+    def update_prefetch_count(self, prefetch_count, callback=None):
+        """Must be called from ioloop thread (e.g. with ioloop.add_callback_threadsafe).
+
+        Prefetch count (not global) is applied only to consumers started after it, so running
+        consumers are restarted. Prefetch count of several consumed queues is split in proportion
+        to their current prefetch counts. Callback is called with prefetch count once it is
+        applied, not called if channel is closed (prefetch count is applied when it is reopened)
+        """
+        if prefetch_count is None or int(prefetch_count) < 1:
+            return
+        prefetch_count = int(prefetch_count)
+        self.options["prefetch_count"] = prefetch_count
+        consume_queues = self.options.get("consume_queues", None)
+        if consume_queues:
+            total_prefetch_count = sum(queue_prefetch for _, queue_prefetch in consume_queues)
+            self.options["consume_queues"] = [
+                (
+                    queue_name,
+                    max(1, round(prefetch_count * queue_prefetch / max(1, total_prefetch_count))),
+                )
+                for queue_name, queue_prefetch in consume_queues
+            ]
+        if self._channel is None or not self._channel.is_open:
+            return
+        logger.info("Updating prefetch count to {}".format(prefetch_count))
+
+        def on_applied(_frame):
+            if callable(callback):
+                callback(prefetch_count)
+
+        def on_cancel_ok(_frame):
+            self.on_pause_ok(_frame)
+            on_applied(_frame)
+
+        def on_qos_ok(_frame):
+            if not self._consuming or not self._consumer_tags:
+                # Consumers started later (e.g. on resume) get new prefetch count
+                on_applied(_frame)
+                return
+            self._cancel_consumers(on_cancel_ok)
+
+        self._channel.basic_qos(prefetch_count=prefetch_count, callback=on_qos_ok)
+
     def start_interacting(self, _unused_frame):
         logger.info("Issuing consumer related RPC commands")
         if self.options.get(
@@ -210,20 +384,77 @@ class PikaSelectConnection:
         self.can_interact = True
         self.__owner_update_can_interact_value()
 
-        if self.is_consumer is True:
+        if self.is_consumer is True and not self._paused:
+            self.start_consuming()
+
+    def start_consuming(self):
+        if self._channel is None or not self._channel.is_open or self._consuming:
+            return
+        if self._cancel_callback_channel is not self._channel:
             self._channel.add_on_cancel_callback(self.on_consumer_cancelled)
-            self._consumer_tag = self._channel.basic_consume(self.queue_name, self.on_message)
-            self._consuming = True
+            self._cancel_callback_channel = self._channel
+        self._consumer_tag = None
+        self._consumer_tags = {}
+        for queue_name, prefetch_count in self.get_consume_queues():
+            if prefetch_count:
+                # Applied to consumers started after it on the channel
+                self._channel.basic_qos(prefetch_count=prefetch_count)
+            consumer_tag = self._channel.basic_consume(queue_name, self.on_message)
+            self._consumer_tags[consumer_tag] = queue_name
+            if self._consumer_tag is None or queue_name == self.queue_name:
+                self._consumer_tag = consumer_tag
+        self._consuming = True
+
+    def _cancel_consumers(self, callback):
+        """Cancels all consumers, callback is called once all cancellations are confirmed"""
+        consumer_tags = set(self._consumer_tags)
+
+        def on_cancel_ok(_frame, consumer_tag):
+            consumer_tags.discard(consumer_tag)
+            if not consumer_tags:
+                callback(_frame)
+
+        for consumer_tag in list(consumer_tags):
+            self._channel.basic_cancel(
+                consumer_tag, functools.partial(on_cancel_ok, consumer_tag=consumer_tag)
+            )
+
+    def pause_consuming(self):
+        """Cancels consumer keeping channel open, already delivered messages stay unacked.
+        Must be called from ioloop thread"""
+        self._paused = True
+        if self._channel is None or not self._channel.is_open or not self._consuming:
+            return
+        logger.info("Pausing consumers {}".format(list(self._consumer_tags)))
+        self._cancel_consumers(self.on_pause_ok)
+
+    def on_pause_ok(self, _unused_frame):
+        self._consuming = False
+        if not self._paused:
+            # Resume was requested before cancellation has been confirmed
+            self.start_consuming()
+
+    def resume_consuming(self):
+        """Must be called from ioloop thread"""
+        self._paused = False
+        if self.is_consumer is True and self.can_interact:
+            logger.info("Resuming consumer")
+            self.start_consuming()
 
     def on_consumer_cancelled(self, method_frame):
         logger.info("Consumer was cancelled remotely, reopen consumer: {}".format(method_frame))
+        self._consuming = False
+        self._consumer_tags.pop(getattr(method_frame.method, "consumer_tag", None), None)
         if (
             self.is_consumer
             and method_frame.channel_number == self._channel.channel_number
             and self._channel.is_open
         ):
-            cb = functools.partial(self.setup_queue, queue_name=self.queue_name)
-            self.connection.ioloop.call_later(self._EMPTY_QUEUE_DELAY, cb)
+            if self._consumer_tags:
+                # Consumers of other queues are restarted together with the cancelled one
+                self._cancel_consumers(self._schedule_consumers_reopen)
+            else:
+                self._schedule_consumers_reopen()
         else:
             if self.connection.is_open:
                 self.connection.ioloop.call_later(
@@ -235,12 +466,16 @@ class PikaSelectConnection:
                 self.__ignore_ack_after = datetime.now().microsecond
                 self.__owner_schedule_graceful_shutdown()
 
+    def _schedule_consumers_reopen(self, _unused_frame=None):
+        cb = functools.partial(self.setup_queue, queue_name=self.queue_name)
+        self.connection.ioloop.call_later(self._EMPTY_QUEUE_DELAY, cb)
+
     @log_current_thread
     def stop_consuming(self):
         if self._channel and self._consuming:
             logger.info("Sending a Basic.Cancel RPC command to RabbitMQ")
             cb = functools.partial(self.on_cancel_ok, consumer_tag=self._consumer_tag)
-            self._channel.basic_cancel(self._consumer_tag, cb)
+            self._cancel_consumers(cb)
         else:
             self.on_cancel_ok(None, None)
 
@@ -309,7 +544,14 @@ class PikaSelectConnection:
                 queue_name=queue_name,
                 properties=properties,
             )
-            self._channel.queue_declare(queue=queue_name, callback=cb, durable=True)
+            # Queue consumed with priorities or dead letter topology must be redeclared with
+            # the same arguments
+            self._channel.queue_declare(
+                queue=queue_name,
+                callback=cb,
+                durable=True,
+                arguments=self.get_declare_arguments(queue_name) or None,
+            )
 
     def publish_to_ensured_queue(self, _unused_frame, message, queue_name, properties):
         self._channel.basic_publish("", queue_name, message, properties)
@@ -337,11 +579,17 @@ class PikaSelectConnection:
 
     @log_current_thread
     def on_message(self, channel, method, properties, body):
-        msg_object = {"channel": channel, "method": method, "properties": properties, "body": body}
+        msg_object = {
+            "channel": channel,
+            "method": method,
+            "properties": properties,
+            "body": body,
+            "queue": self._consumer_tags.get(method.consumer_tag, self.queue_name),
+        }
         self.__owner_call_on_msg_consumed_handler(msg_object)
 
     @log_current_thread
-    def acknowledge_message(self, delivery_tag):
+    def acknowledge_message(self, delivery_tag, multiple=False):
         if self.__ignore_ack_after:
             logger.info(
                 f"Skip acknowledgement. Reason: ignore ack after is set. "
@@ -350,9 +598,14 @@ class PikaSelectConnection:
             return
 
         if self._channel is not None and self._channel.is_open:
-            self._channel.basic_ack(delivery_tag)
+            self._channel.basic_ack(delivery_tag, multiple=multiple)
 
-    def negative_acknowledge_message(self, delivery_tag):
+    def acknowledge_messages(self, delivery_tags):
+        """Acks batch of messages within single ioloop callback"""
+        for delivery_tag in delivery_tags:
+            self.acknowledge_message(delivery_tag)
+
+    def negative_acknowledge_message(self, delivery_tag, requeue=True, multiple=False):
         if self.__ignore_ack_after:
             logger.info(
                 f"Skip acknowledgement. Reason: ignore nack after is set. "
@@ -360,7 +613,63 @@ class PikaSelectConnection:
             )
             return
         if self._channel is not None and self._channel.is_open:
-            self._channel.basic_nack(delivery_tag)
+            self._channel.basic_nack(delivery_tag, multiple=multiple, requeue=requeue)
+
+    def reject_message(
+        self, delivery_tag, body, properties: pika.BasicProperties = None, queue_name=None
+    ):
+        """Negative acknowledgement of failed message consumed from queue_name (default queue).
+        With dead letter topology enabled the message is republished to the retry queue of current
+        attempt (and original delivery is acked) or dead lettered to DLQ if max attempts exceeded.
+        Otherwise message is requeued"""
+        if not self.options.get("dead_letter_enabled", False):
+            self.negative_acknowledge_message(delivery_tag)
+            return
+        if self.__ignore_ack_after:
+            logger.info(
+                f"Skip acknowledgement. Reason: ignore nack after is set. "
+                f"Ignore ts:{self.__ignore_ack_after} ms"
+            )
+            return
+        if self._channel is None or not self._channel.is_open:
+            return
+
+        attempts_header = RMQConstants.ATTEMPTS_HEADER.value
+        headers = dict(properties.headers or {}) if properties is not None else {}
+        attempts = int(headers.get(attempts_header, 0)) + 1
+        retry_delays = sorted(set(self.options.get("retry_delays", [])))
+        if attempts >= self.options.get("max_attempts", 1) or not len(retry_delays):
+            logger.warning(
+                f"Message {delivery_tag} failed {attempts} times, moving to dead letter queue"
+            )
+            self._channel.basic_nack(delivery_tag, requeue=False)
+            return
+
+        headers[attempts_header] = attempts
+        retry_properties = pika.BasicProperties(
+            content_type=getattr(properties, "content_type", None) or "application/json",
+            delivery_mode=2,
+            headers=headers,
+            reply_to=getattr(properties, "reply_to", None),
+            correlation_id=getattr(properties, "correlation_id", None),
+            message_id=getattr(properties, "message_id", None),
+            priority=getattr(properties, "priority", None),
+        )
+        delay = retry_delays[min(attempts, len(retry_delays)) - 1]
+        self._channel.basic_publish(
+            "",
+            self.get_retry_queue_name(queue_name or self.queue_name, delay),
+            body,
+            retry_properties,
+        )
+        self._channel.basic_ack(delivery_tag)
+
+    def republish_message(self, delivery_tag, body, properties, queue_name):
+        """Moves consumed message to another existing queue (no declaration made)"""
+        if self._channel is None or not self._channel.is_open:
+            return
+        self._channel.basic_publish("", queue_name, body, properties)
+        self._channel.basic_ack(delivery_tag)
 
     @log_current_thread
     def run(self):
@@ -1,23 +1,36 @@
 import functools
-import json
 import logging
-from copy import deepcopy
-from enum import IntEnum
+import signal as system_signal
+import time
+from collections import OrderedDict
+from enum import Enum, IntEnum
 
 import pika
 import scrapy
+from pydispatch.dispatcher import getAllReceivers, liveReceivers
 from scrapy import signals
-from scrapy.core.downloader.handlers.http11 import TunnelError
 from scrapy.exceptions import CloseSpider, DontCloseSpider
-from scrapy.spidermiddlewares.httperror import HttpError
 from twisted.internet import reactor, task
-from twisted.internet.error import DNSLookupError, TCPTimedOutError, TimeoutError
 
 # import rmq module specific
 from rmq.connections import PikaSelectConnection
 from rmq.signals import callback_completed, errback_completed, item_scheduled
-from rmq.utils import RMQConstants, RMQDefaultOptions, Task, TaskObserver, TaskStatusCodes
+from rmq.utils import (
+    MessageDeduplicator,
+    ProcessOffloader,
+    ReplyAggregator,
+    RMQConstants,
+    RMQDefaultOptions,
+    Task,
+    TaskObserver,
+    TaskJournal,
+    TaskStatusCodes,
+    TaskWatchdog,
+    get_queue_options,
+    is_hardware_error,
+)
 from rmq.utils.decorators import call_once, rmq_callback, rmq_errback
+from rmq.utils.decorators.decorated_methods_registry import get_decorated_methods
 
 logger = logging.getLogger(__name__)
 
@@ -29,7 +42,14 @@ class RPCTaskConsumer(object):
         STRONG_ITEMS_BASED = 2
         DEFAULT = REQUESTS_BASED
 
-    _RELIEVE_DELAY = 3
+    _WATCHDOG_DELAY = 1
+    _THROTTLE_DELAY = 1
+    _DRAIN_CHECK_DELAY = 1
+
+    class TimeoutPolicies(Enum):
+        ACK = "ack"
+        NACK = "nack"
+        DEFAULT = ACK
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -42,16 +62,19 @@ class RPCTaskConsumer(object):
         """Subscribe to signals which controls requests scheduling and responses or error retrieving"""
         crawler.signals.connect(o.on_request_scheduled, signal=signals.request_scheduled)
         crawler.signals.connect(o.on_request_dropped, signal=signals.request_dropped)
-        crawler.signals.connect(o.on_callback_completed, signal=callback_completed)
-        crawler.signals.connect(o.on_errback_completed, signal=errback_completed)
         crawler.signals.connect(o.on_spider_error, signal=signals.spider_error)
 
         """Subscribe to signals which controls item processing"""
-        crawler.signals.connect(o.on_item_scheduled, signal=item_scheduled)
         crawler.signals.connect(o.on_item_scraped, signal=signals.item_scraped)
         crawler.signals.connect(o.on_item_dropped, signal=signals.item_dropped)
         crawler.signals.connect(o.on_item_error, signal=signals.item_error)
 
+        """In direct dispatch mode rmq decorators events are delivered with plain method calls"""
+        if not o.direct_dispatch:
+            crawler.signals.connect(o.on_callback_completed, signal=callback_completed)
+            crawler.signals.connect(o.on_errback_completed, signal=errback_completed)
+            crawler.signals.connect(o.on_item_scheduled, signal=item_scheduled)
+
         return o
 
     def __init__(self, crawler):
@@ -62,12 +85,37 @@ class RPCTaskConsumer(object):
         self.completion_strategy = RPCTaskConsumer.CompletionStrategies.DEFAULT
         self.delivery_tag_meta_key = RMQConstants.DELIVERY_TAG_META_KEY.value
         self.msg_body_meta_key = RMQConstants.MSG_BODY_META_KEY.value
+        self.sub_task_meta_key = RMQConstants.SUB_TASK_META_KEY.value
+        self.sub_task_replies = crawler.settings.getbool("RMQ_SUB_TASK_REPLIES", False)
+        self._expanding_task = None
+        self.coalesce_key = crawler.settings.get("RMQ_COALESCE_KEY", None) or None
+        self._coalesced_leaders = {}
+        # queue name -> {"weight": int, "reply_to": str or None} if spider consumes several queues
+        self.task_queues = {}
 
         self.rmq_connection = None
         self._can_interact = False
         self._can_get_next_message = False
-        self._relieve_task = None
-        self.pending_relieve = {"ack": [], "nack": []}
+        # delivery tag -> task finalized while connection was not able to interact (ordered sets)
+        self.pending_relieve = {"ack": OrderedDict(), "nack": OrderedDict()}
+        self.deduplicator = None
+        self.reply_aggregator = None
+        self.journal = None
+        self.process_offloader = None
+        self.watchdog = TaskWatchdog()
+        self.timeout_policy = RPCTaskConsumer.TimeoutPolicies.DEFAULT
+        self._watchdog_task = None
+        self.direct_dispatch = crawler.settings.getbool("RMQ_DIRECT_DISPATCH", False)
+        self.scheduler_threshold = 0
+        self.scheduler_low_watermark = 0
+        self._is_consuming_paused = False
+        self._throttle_task = None
+        self._external_receivers = {}
+        self.drain_timeout = 0
+        self._is_draining = False
+        self._drain_deadline = None
+        self._drain_task = None
+        self._previous_sigterm_handler = None
 
     def spider_opened(self, spider):
         """execute on spider_opened signal and initialize connection, callbacks, start consuming"""
@@ -86,13 +134,49 @@ class RPCTaskConsumer(object):
         )
         if not isinstance(self.completion_strategy, RPCTaskConsumer.CompletionStrategies):
             self.completion_strategy = RPCTaskConsumer.CompletionStrategies.DEFAULT
+        if self.direct_dispatch:
+            self._external_receivers = {
+                signal: self._has_receivers(signal)
+                for signal in (item_scheduled, callback_completed, errback_completed)
+            }
+            self.__spider.processing_tasks.set_listener(self)
+        self.deduplicator = MessageDeduplicator.from_settings(self.__spider.settings)
+        self.reply_aggregator = ReplyAggregator.from_settings(
+            self.__spider.settings, self._publish_reply
+        )
+        self.reply_aggregator.start()
+        self.journal = TaskJournal.from_settings(self.__spider.settings)
+        if self.journal is not None:
+            self.journal.open()
+        self.process_offloader = ProcessOffloader.from_settings(self.__spider.settings)
+        self.process_offloader.start()
+        self.watchdog = TaskWatchdog(
+            deadline=self.__spider.settings.getint("RMQ_TASK_DEADLINE", 0),
+            inactivity_timeout=self.__spider.settings.getint("RMQ_TASK_INACTIVITY_TIMEOUT", 0),
+        )
+        self.timeout_policy = RPCTaskConsumer.TimeoutPolicies(
+            self.__spider.settings.get(
+                "RMQ_TASK_TIMEOUT_POLICY", RPCTaskConsumer.TimeoutPolicies.DEFAULT.value
+            )
+        )
+        self.scheduler_threshold = max(0, self.__spider.settings.getint("SCHEDULER_THRESHOLD", 0))
+        self.scheduler_low_watermark = min(
+            self.scheduler_threshold,
+            max(
+                0,
+                self.__spider.settings.getint(
+                    "SCHEDULER_LOW_WATERMARK", self.scheduler_threshold // 2
+                ),
+            ),
+        )
 
         """Configure loggers"""
         logger.setLevel(self.__spider.settings.get("LOG_LEVEL", "INFO"))
         logging.getLogger("pika").setLevel(self.__spider.settings.get("PIKA_LOG_LEVEL", "WARNING"))
 
-        """Declare/retrieve queue name from spider instance"""
-        task_queue_name = spider.task_queue_name
+        """Declare/retrieve queue name(s) from spider instance"""
+        self.task_queues = self._init_task_queues()
+        task_queue_name = getattr(spider, "task_queue_name", None) or next(iter(self.task_queues))
 
         """Build pika connection parameters and start connection in separate twisted thread"""
         parameters = pika.ConnectionParameters(
@@ -107,12 +191,48 @@ class RPCTaskConsumer(object):
         )
         reactor.callInThread(self.connect, parameters, task_queue_name)
 
-        """Declare fallback LoopingCall to ack/nack probably unacked messages (or before scheduled shutdown)"""
-        self._relieve_task = task.LoopingCall(self._relieve)
-        self._relieve_task.start(self._RELIEVE_DELAY)
+        if self.watchdog.is_enabled():
+            self._watchdog_task = task.LoopingCall(self._finalize_expired_tasks)
+            self._watchdog_task.start(self._WATCHDOG_DELAY, now=False)
+
+        """Pause consuming while scheduler backlog is above threshold"""
+        if self.scheduler_threshold > 0:
+            self._throttle_task = task.LoopingCall(self._throttle_consuming)
+            self._throttle_task.start(self._THROTTLE_DELAY, now=False)
+
+        """Drain in-flight tasks on SIGTERM instead of immediate shutdown"""
+        self.drain_timeout = max(0, self.__spider.settings.getint("RMQ_DRAIN_TIMEOUT", 0))
+        if self.drain_timeout > 0:
+            self._previous_sigterm_handler = system_signal.signal(
+                system_signal.SIGTERM, self._on_sigterm
+            )
 
     def spider_closed(self, spider):
+        # Messages delivered from now on are requeued by broker once connection is closed
+        self._is_draining = True
+        if self._throttle_task is not None and self._throttle_task.running:
+            self._throttle_task.stop()
+        if self._drain_task is not None and self._drain_task.running:
+            self._drain_task.stop()
+        if self._previous_sigterm_handler is not None:
+            system_signal.signal(system_signal.SIGTERM, self._previous_sigterm_handler)
+            self._previous_sigterm_handler = None
+        if self.direct_dispatch and isinstance(
+            getattr(spider, "processing_tasks", None), TaskObserver
+        ):
+            spider.processing_tasks.set_listener(None)
+        if self._watchdog_task is not None and self._watchdog_task.running:
+            self._watchdog_task.stop()
+        if self.reply_aggregator is not None:
+            # Buffered replies are published and their tasks acked before unacked are requeued,
+            # tasks of replies which can not be published are requeued
+            self.reply_aggregator.close()
         self._relieve()
+        self._requeue_unfinished_tasks(spider)
+        if self.deduplicator is not None:
+            self.deduplicator.close()
+        if self.process_offloader is not None:
+            self.process_offloader.close()
         if self.rmq_connection is not None and isinstance(
             self.rmq_connection, PikaSelectConnection
         ):
@@ -120,22 +240,52 @@ class RPCTaskConsumer(object):
                 self.rmq_connection.connection.ioloop.add_callback_threadsafe(
                     self.rmq_connection.stop
                 )
+        if self.journal is not None:
+            return self.journal.close()
 
     def spider_idle(self, spider):
         raise DontCloseSpider
 
+    def _has_receivers(self, signal):
+        receivers = liveReceivers(getAllReceivers(self.crawler.signals.sender, signal))
+        return any(True for _ in receivers)
+
+    def has_external_receivers(self, signal):
+        """Receivers are resolved once on spider_opened, connect them in from_crawler"""
+        return self._external_receivers.get(signal, False)
+
+    def on_task_event(self, signal, spider=None, response=None, failure=None, delivery_tag=None):
+        """Direct dispatch mode entry point for events of rmq_callback and rmq_errback"""
+        try:
+            if signal is item_scheduled:
+                self.on_item_scheduled(response, spider, delivery_tag)
+            elif signal is callback_completed:
+                self.on_callback_completed(response, spider, delivery_tag)
+            elif signal is errback_completed:
+                self.on_errback_completed(failure, spider, delivery_tag)
+        except Exception:
+            logger.error(f"Error caught on task event handler: {signal}", exc_info=True)
+
     def on_request_scheduled(self, request, spider):
         if (
             self.delivery_tag_meta_key in request.meta.keys()
             and request.meta.get("retry_times") is None
         ):
             delivery_tag = request.meta.get(self.delivery_tag_meta_key)
-            spider.processing_tasks.handle_request(delivery_tag)
+            current_task = spider.processing_tasks.get_task(delivery_tag)
+            if current_task is None:
+                """Task is already finalized (e.g. by timeout)"""
+                return
+            current_task.request_scheduled()
+            sub_task = request.meta.get(self.sub_task_meta_key, None)
+            if sub_task is not None:
+                current_task.sub_task_request_scheduled(sub_task)
 
     def on_request_dropped(self, request, spider):
         if self.delivery_tag_meta_key in request.meta.keys():
             delivery_tag = request.meta.get(self.delivery_tag_meta_key)
             spider.processing_tasks.handle_response(delivery_tag, 600)
+            self._handle_sub_task_response(spider, request.meta, delivery_tag, is_success=False)
             self._check_is_completed(spider, delivery_tag)
 
     def on_callback_completed(self, response=None, spider=None, delivery_tag=None):
@@ -146,6 +296,9 @@ class RPCTaskConsumer(object):
                 else delivery_tag
             )
             spider.processing_tasks.handle_response(delivery_tag, response.status)
+            self._handle_sub_task_response(
+                spider, response.meta, delivery_tag, is_success=200 <= response.status < 300
+            )
         self._check_is_completed(spider, delivery_tag)
 
     def on_errback_completed(self, failure=None, spider=None, delivery_tag=None):
@@ -155,27 +308,51 @@ class RPCTaskConsumer(object):
                 if delivery_tag is None
                 else delivery_tag
             )
-            if spider.processing_tasks.get_task(delivery_tag).failed_responses == 0:
+            current_task = spider.processing_tasks.get_task(delivery_tag)
+            if current_task is not None and (
+                current_task.sub_tasks is not None or current_task.failed_responses == 0
+            ):
+                """Fan-out task has errback call per failed request"""
                 spider.processing_tasks.handle_response(delivery_tag, 600)
+                self._handle_sub_task_response(
+                    spider, failure.request.meta, delivery_tag, is_success=False
+                )
         self._check_is_completed(spider, delivery_tag)
 
+    def _handle_sub_task_response(self, spider, meta, delivery_tag, is_success):
+        sub_task = meta.get(self.sub_task_meta_key, None)
+        if sub_task is None:
+            return
+        current_task = spider.processing_tasks.get_task(delivery_tag)
+        if current_task is None:
+            return
+        sub_task_status = current_task.sub_task_response_received(sub_task, is_success)
+        if (
+            sub_task_status is not None
+            and self.sub_task_replies
+            and current_task.reply_to is not None
+            and self.reply_aggregator is not None
+        ):
+            """Sub-task reply is task payload marked with sub-task index"""
+            self.reply_aggregator.add(
+                current_task.reply_to,
+                {
+                    **current_task.payload,
+                    "status": sub_task_status,
+                    self.sub_task_meta_key: sub_task,
+                },
+            )
+
     def on_spider_error(self, failure, response, spider):
         delivery_tag = response.meta.get(self.delivery_tag_meta_key)
         if delivery_tag is not None:
-            hardware_errors = [
-                HttpError,
-                TunnelError,
-                TimeoutError,
-                TCPTimedOutError,
-                DNSLookupError,
-            ]
-            if failure.check(*hardware_errors) is not None:
+            if is_hardware_error(failure):
                 spider.processing_tasks.set_status(delivery_tag, TaskStatusCodes.HARDWARE_ERROR)
             else:
                 spider.processing_tasks.set_status(delivery_tag, TaskStatusCodes.ERROR)
             self._check_is_completed(spider, delivery_tag)
 
-    def on_item_scheduled(self, response, spider, delivery_tag):
+    def on_item_scheduled(self, response=None, spider=None, delivery_tag=None):
         if response is not None and spider is not None:
             delivery_tag = (
                 response.meta.get(self.delivery_tag_meta_key, None)
@@ -192,61 +369,46 @@ class RPCTaskConsumer(object):
             spider.processing_tasks.handle_item_scheduled(delivery_tag)
         # self._check_is_completed(spider, delivery_tag)
 
+    def _get_item_task(self, item, response, spider):
+        """Resolves delivery tag and task of processed item with single observer lookup"""
+        if response is None or spider is None:
+            return None
+        delivery_tag = response.meta.get(self.delivery_tag_meta_key, None)
+        if delivery_tag is None and hasattr(item, self.delivery_tag_meta_key):
+            delivery_tag = getattr(item, self.delivery_tag_meta_key, None)
+        if delivery_tag is None:
+            return None
+        current_task = spider.processing_tasks.get_task(delivery_tag)
+        if (
+            current_task is None
+            and self.completion_strategy != RPCTaskConsumer.CompletionStrategies.WEAK_ITEMS_BASED
+        ):
+            raise ValueError(f"Delivery tag {delivery_tag} is not exists in observer")
+        return current_task
+
     def on_item_scraped(self, item, response, spider):
-        if response is not None and spider is not None:
-            delivery_tag = response.meta.get(self.delivery_tag_meta_key, None)
-            if delivery_tag is None and hasattr(item, self.delivery_tag_meta_key):
-                delivery_tag = getattr(item, self.delivery_tag_meta_key, None)
-            if delivery_tag is not None:
-                current_task = spider.processing_tasks.get_task(delivery_tag)
-                if (
-                    not current_task
-                    and self.completion_strategy
-                    == RPCTaskConsumer.CompletionStrategies.WEAK_ITEMS_BASED
-                ):
-                    return
-                spider.processing_tasks.handle_item_scraped(delivery_tag)
+        current_task = self._get_item_task(item, response, spider)
+        if current_task is not None:
+            current_task.item_scraped_received()
+            if self.journal is not None:
+                self.journal.checkpoint(current_task.message_key, current_task.get_counters())
 
     def on_item_dropped(self, item, response, exception, spider):
-        if response is not None and spider is not None:
-            delivery_tag = response.meta.get(self.delivery_tag_meta_key, None)
-            if delivery_tag is None and hasattr(item, self.delivery_tag_meta_key):
-                delivery_tag = getattr(item, self.delivery_tag_meta_key, None)
-            if delivery_tag is not None:
-                current_task = spider.processing_tasks.get_task(delivery_tag)
-                if (
-                    not current_task
-                    and self.completion_strategy
-                    == RPCTaskConsumer.CompletionStrategies.WEAK_ITEMS_BASED
-                ):
-                    return
-                spider.processing_tasks.handle_item_dropped(delivery_tag)
+        current_task = self._get_item_task(item, response, spider)
+        if current_task is not None:
+            current_task.item_dropped_received()
 
     def on_item_error(self, item, response, exception, spider):
-        if response is not None and spider is not None:
-            delivery_tag = response.meta.get(self.delivery_tag_meta_key, None)
-            if delivery_tag is None and hasattr(item, self.delivery_tag_meta_key):
-                delivery_tag = getattr(item, self.delivery_tag_meta_key, None)
-            if delivery_tag is not None:
-                current_task = spider.processing_tasks.get_task(delivery_tag)
-                if (
-                    not current_task
-                    and self.completion_strategy
-                    == RPCTaskConsumer.CompletionStrategies.WEAK_ITEMS_BASED
-                ):
-                    return
-                spider.processing_tasks.handle_item_error(delivery_tag)
+        current_task = self._get_item_task(item, response, spider)
+        if current_task is not None:
+            current_task.item_error_received()
 
     def _check_is_completed(self, spider=None, delivery_tag=None):
         if spider is None:
             spider = self.__spider
         if delivery_tag is not None and spider is not None:
             current_task = spider.processing_tasks.get_task(delivery_tag)
-            if (
-                not current_task
-                and self.completion_strategy
-                is RPCTaskConsumer.CompletionStrategies.WEAK_ITEMS_BASED
-            ):
+            if not current_task or current_task is self._expanding_task:
                 return
             is_completed = False
             if self.completion_strategy == RPCTaskConsumer.CompletionStrategies.REQUESTS_BASED:
@@ -298,64 +460,177 @@ class RPCTaskConsumer(object):
                         else:
                             current_task.status = TaskStatusCodes.PARTIAL_SUCCESS
             if is_completed:
-                if current_task.reply_to is not None:
-                    payload = {**deepcopy(current_task.payload), **{"status": current_task.status}}
-                    if isinstance(self.rmq_connection.connection, pika.SelectConnection):
-                        cb = functools.partial(
-                            self.rmq_connection.publish_message,
-                            message=json.dumps(payload),
-                            queue_name=current_task.reply_to,
-                        )
-                    self.rmq_connection.connection.ioloop.add_callback_threadsafe(cb)
-
-                if self._can_interact and self.__spider is not None:
-                    # logger.critical('TASK MUST BE ACKED HERE ' * 4)
-                    current_task.ack()
-                    # pass
-                else:
-                    # Note: possible deprecated to store delivery tags internally and LoopingCall: _relieve is redundant
-                    if delivery_tag not in self.pending_relieve["ack"]:
-                        self.pending_relieve["ack"].append(delivery_tag)
-
-                if hasattr(spider, "processing_tasks") and isinstance(
-                    spider.processing_tasks, TaskObserver
-                ):
-                    spider.processing_tasks.remove_task(delivery_tag)
+                self._finalize_task(spider, current_task)
+
+    def _finalize_task(self, spider, current_task, should_ack=True):
+        """Replies to reply_to queue, acks (or nacks) and forgets completed task"""
+        delivery_tag = current_task.delivery_tag
+        if should_ack and self.deduplicator is not None:
+            self.deduplicator.mark_processed(current_task.message_key)
+        if self.journal is not None:
+            if should_ack:
+                self.journal.task_completed(current_task.message_key, current_task.status)
+            else:
+                self.journal.task_failed(current_task.message_key)
+        if self.task_queues and current_task.source_queue is not None:
+            self.crawler.stats.inc_value(
+                f"rmq/queue/{current_task.source_queue}/"
+                f"{'completed_count' if should_ack else 'failed_count'}",
+                spider=spider,
+            )
+        settle = functools.partial(self._settle_task, current_task, should_ack)
+        if current_task.reply_to is not None and self.reply_aggregator is not None:
+            # Task is acked once its (possibly batched) reply is published
+            self.reply_aggregator.add(
+                current_task.reply_to,
+                {**current_task.payload, "status": current_task.status},
+                on_published=settle,
+            )
+        else:
+            settle()
+        if self.coalesce_key is not None:
+            self._finalize_followers(spider, current_task, should_ack)
 
-    def _validate_spider_has_attributes(self):
-        spider_attributes = [
-            attr for attr in dir(self.__spider) if not callable(getattr(self.__spider, attr))
-        ]
-        if "task_queue_name" not in spider_attributes:
+        if hasattr(spider, "processing_tasks") and isinstance(
+            spider.processing_tasks, TaskObserver
+        ):
+            spider.processing_tasks.remove_task(delivery_tag)
+
+    def _settle_task(self, current_task, should_ack):
+        if self._can_interact and self.__spider is not None:
+            if should_ack:
+                current_task.ack()
+            else:
+                current_task.nack()
+        else:
+            # Sent by _relieve when connection is able to interact again
+            self.pending_relieve["ack" if should_ack else "nack"][
+                current_task.delivery_tag
+            ] = current_task
+
+    def _get_coalesce_value(self, rmq_task):
+        if not isinstance(rmq_task.payload, dict):
+            return None
+        value = rmq_task.payload.get(self.coalesce_key, None)
+        return value if isinstance(value, (str, int, float)) else None
+
+    def _coalesce(self, rmq_task):
+        """Attaches task to in-flight task with the same coalesce key value, unless that task
+        has already produced items (they are not replayed, so duplicate would receive partial
+        results). In that case task is crawled and becomes leader for later duplicates.
+        Returns True if task became a follower and must not be crawled"""
+        value = self._get_coalesce_value(rmq_task)
+        if value is None:
+            return False
+        leader = self._coalesced_leaders.get(value, None)
+        if leader is None or self._has_items(leader):
+            self._coalesced_leaders[value] = rmq_task
             return False
+        if leader.followers is None:
+            leader.followers = []
+        leader.followers.append(rmq_task)
+        logger.debug(f"Task {rmq_task.delivery_tag} coalesced with {leader.delivery_tag}")
+        self.crawler.stats.inc_value("rmq/coalesce/followers_count", spider=self.__spider)
+        return True
+
+    @staticmethod
+    def _has_items(rmq_task):
+        return (
+            rmq_task.scheduled_items > 0
+            or rmq_task.scraped_items > 0
+            or rmq_task.dropped_items > 0
+            or rmq_task.error_items > 0
+        )
+
+    def _finalize_followers(self, spider, leader, should_ack):
+        value = self._get_coalesce_value(leader)
+        if value is not None and self._coalesced_leaders.get(value, None) is leader:
+            del self._coalesced_leaders[value]
+        followers, leader.followers = leader.followers, None
+        for follower in followers or ():
+            follower.status = leader.status
+            self._finalize_task(spider, follower, should_ack)
+
+    def _publish_reply(self, queue_name, message, replies_count):
+        """Returns False if connection is not ready, replies are kept by aggregator and their
+        tasks are not acked until replies are published"""
         if (
-            not isinstance(self.__spider.task_queue_name, str)
-            or len(self.__spider.task_queue_name) == 0
+            not self._can_interact
+            or self.rmq_connection is None
+            or not isinstance(self.rmq_connection.connection, pika.SelectConnection)
         ):
+            logger.warning(f"Connection is not ready, {replies_count} replies kept: {queue_name}")
             return False
-        if "processing_tasks" not in spider_attributes:
-            return False
-        if not isinstance(self.__spider.processing_tasks, TaskObserver):
+        properties = None
+        if self.reply_aggregator.is_batching():
+            properties = pika.BasicProperties(
+                content_type="application/json",
+                delivery_mode=2,
+                headers={RMQConstants.REPLY_BATCH_SIZE_HEADER.value: replies_count},
+            )
+        cb = functools.partial(
+            self.rmq_connection.publish_message,
+            message=message,
+            queue_name=queue_name,
+            properties=properties,
+        )
+        self.rmq_connection.connection.ioloop.add_callback_threadsafe(cb)
+        return True
+
+    def _finalize_expired_tasks(self):
+        spider = self.__spider
+        if spider is None:
+            return
+        for expired_task in self.watchdog.pop_expired(spider.processing_tasks):
+            logger.warning(f"Task {expired_task.delivery_tag} timed out: {expired_task}")
+            expired_task.status = TaskStatusCodes.TIMEOUT
+            self.crawler.stats.inc_value("rmq/task/timeout_count", spider=spider)
+            self._finalize_task(
+                spider,
+                expired_task,
+                should_ack=self.timeout_policy == RPCTaskConsumer.TimeoutPolicies.ACK,
+            )
+
+    def _init_task_queues(self):
+        """Spider may consume several queues declaring task_queues attribute as dict of
+        queue name -> weight or {"weight": weight, "reply_to": default reply queue}.
+        Prefetch count (CONCURRENT_REQUESTS) is split between queues proportionally to weights"""
+        task_queues = {}
+        spider_task_queues = getattr(self.__spider, "task_queues", None) or {}
+        for queue_name, queue_options in spider_task_queues.items():
+            if not isinstance(queue_options, dict):
+                queue_options = {"weight": queue_options}
+            task_queues[queue_name] = {
+                "weight": max(1, int(queue_options.get("weight", 1) or 1)),
+                "reply_to": queue_options.get("reply_to", None),
+            }
+        return task_queues
+
+    def get_consume_queues(self, prefetch_count):
+        total_weight = sum(options["weight"] for options in self.task_queues.values())
+        return [
+            (queue_name, max(1, round(prefetch_count * options["weight"] / total_weight)))
+            for queue_name, options in self.task_queues.items()
+        ]
+
+    def _validate_spider_has_attributes(self):
+        task_queues = getattr(self.__spider, "task_queues", None)
+        if isinstance(task_queues, dict) and len(task_queues) > 0:
+            if not all(isinstance(queue_name, str) and queue_name for queue_name in task_queues):
+                return False
+        else:
+            task_queue_name = getattr(self.__spider, "task_queue_name", None)
+            if not isinstance(task_queue_name, str) or len(task_queue_name) == 0:
+                return False
+        if not isinstance(getattr(self.__spider, "processing_tasks", None), TaskObserver):
             return False
         return True
 
     def _validate_spider_has_decorators(self):
-        callback_decorated_funcs_count = 0
-        errback_decorated_funcs_count = 0
-        spider_method_list = [
-            func
-            for func in dir(self.__spider)
-            if callable(getattr(self.__spider, func)) and not func.startswith("__")
-        ]
-        for spider_method in spider_method_list:
-            spider_method_attr = getattr(self.__spider, spider_method)
-            if hasattr(spider_method_attr, "__wrapped__"):
-                if hasattr(spider_method_attr, "__decorator_name__"):
-                    decorator_name = getattr(spider_method_attr, "__decorator_name__")
-                    if decorator_name == rmq_callback.__name__:
-                        callback_decorated_funcs_count += 1
-                    if decorator_name == rmq_errback.__name__:
-                        errback_decorated_funcs_count += 1
+        """Decorated methods are registered by rmq decorators at class definition time"""
+        decorator_names = list(get_decorated_methods(type(self.__spider)).values())
+        callback_decorated_funcs_count = decorator_names.count(rmq_callback.__name__)
+        errback_decorated_funcs_count = decorator_names.count(rmq_errback.__name__)
         logger.debug(f"callback_decorated_funcs_count: {callback_decorated_funcs_count}")
         logger.debug(f"errback_decorated_funcs_count: {errback_decorated_funcs_count}")
         if callback_decorated_funcs_count == 0 or errback_decorated_funcs_count == 0:
@@ -363,29 +638,113 @@ class RPCTaskConsumer(object):
         return True
 
     def set_connection_handle(self, connection):
+        pending_count = len(self.pending_relieve["ack"]) + len(self.pending_relieve["nack"])
+        if pending_count:
+            """Delivery tags are scoped to channel of previous connection, its unacked messages
+            are redelivered by broker"""
+            logger.warning(f"Drop {pending_count} pending acks/nacks of previous connection")
+            self.pending_relieve["ack"].clear()
+            self.pending_relieve["nack"].clear()
+        if self.reply_aggregator is not None:
+            dropped_count = self.reply_aggregator.clear()
+            if dropped_count:
+                """Tasks of not published replies are redelivered by broker and replied again"""
+                logger.warning(f"Drop {dropped_count} replies of previous connection")
         self.rmq_connection = connection
         self._can_interact = True
         self._can_get_next_message = True
+        self._relieve()
 
     def set_can_interact(self, can_interact):
         self._can_interact = can_interact
         self._can_get_next_message = can_interact
+        if can_interact:
+            self._relieve()
 
-    def raise_close_spider(self):
+    def raise_close_spider(self, reason="cancelled"):
         if self.crawler.engine.slot is None or self.crawler.engine.slot.closing:
             logger.critical("SPIDER ALREADY CLOSED")
             return
-        self.crawler.engine.close_spider(self.__spider)
+        self.crawler.engine.close_spider(self.__spider, reason)
+
+    def _on_sigterm(self, signum, frame):
+        if self._is_draining:
+            """Second signal falls back to default (scrapy) shutdown"""
+            if callable(self._previous_sigterm_handler):
+                self._previous_sigterm_handler(signum, frame)
+            return
+        reactor.callFromThread(self.start_drain)
+
+    def start_drain(self):
+        """Cancels consumers and closes spider when in-flight tasks are finished or drain timeout
+        is exceeded. Unfinished tasks are requeued on spider_closed"""
+        if self._is_draining or self.__spider is None:
+            return
+        self._is_draining = True
+        logger.info(
+            f"Draining {self.__spider.processing_tasks.current_processing_count()} in-flight "
+            f"tasks, timeout {self.drain_timeout} seconds"
+        )
+        if self._throttle_task is not None and self._throttle_task.running:
+            self._throttle_task.stop()
+        if self.rmq_connection is not None and isinstance(
+            self.rmq_connection.connection, pika.SelectConnection
+        ):
+            self.rmq_connection.connection.ioloop.add_callback_threadsafe(
+                self.rmq_connection.pause_consuming
+            )
+        self._drain_deadline = time.monotonic() + self.drain_timeout
+        self._drain_task = task.LoopingCall(self._check_drain)
+        self._drain_task.start(self._DRAIN_CHECK_DELAY, now=False)
+
+    def _check_drain(self):
+        if (
+            not self.__spider.processing_tasks.is_empty()
+            and time.monotonic() < self._drain_deadline
+        ):
+            return
+        self._drain_task.stop()
+        self.raise_close_spider("shutdown")
+
+    def _requeue_unfinished_tasks(self, spider):
+        """Returns all unacked messages to their queues with single nack (delivery tag 0 with
+        multiple flag), must be called after completed tasks are acked"""
+        processing_tasks = getattr(spider, "processing_tasks", None)
+        if not isinstance(processing_tasks, TaskObserver) or processing_tasks.is_empty():
+            return
+        unfinished_count = processing_tasks.current_processing_count()
+        for delivery_tag in list(processing_tasks.get_all()):
+            processing_tasks.remove_task(delivery_tag)
+        self.crawler.stats.set_value("rmq/drain/requeued_count", unfinished_count, spider=spider)
+        if not self._can_interact or not isinstance(
+            self.rmq_connection.connection, pika.SelectConnection
+        ):
+            logger.warning(f"{unfinished_count} unfinished tasks are left to channel close")
+            return
+        logger.info(f"Requeue {unfinished_count} unfinished tasks")
+        self.rmq_connection.connection.ioloop.add_callback_threadsafe(
+            functools.partial(
+                self.rmq_connection.negative_acknowledge_message,
+                delivery_tag=0,
+                requeue=True,
+                multiple=True,
+            )
+        )
 
     def connect(self, parameters, queue_name):
+        prefetch_count = self.__spider.settings.getint("CONCURRENT_REQUESTS", 1)
+        options = {
+            "enable_delivery_confirmations": False,
+            "prefetch_count": prefetch_count,
+            **get_queue_options(self.__spider.settings),
+        }
+        if self.task_queues:
+            options["consume_queues"] = self.get_consume_queues(prefetch_count)
         c = PikaSelectConnection(
             parameters,
             queue_name,
             owner=self,
-            options={
-                "enable_delivery_confirmations": False,
-                "prefetch_count": self.__spider.settings.get("CONCURRENT_REQUESTS", 1),
-            },
+            options=options,
             is_consumer=True,
         )
         logger.info("Pika threaded event start")
@@ -393,19 +752,37 @@ class RPCTaskConsumer(object):
         logger.info("Pika threaded event loop stopped and exited")
 
     def _relieve(self):
-        if self._can_interact:
-            pending_ack = self.pending_relieve["ack"]
-            pending_nack = self.pending_relieve["nack"]
-            if len(pending_ack) == 0 and len(pending_nack) == 0:
-                return
-            while len(pending_ack):
-                delivery_tag = pending_ack.pop(0)
-                self.__spider.processing_tasks.get_task(delivery_tag).ack()
-            while len(pending_nack):
-                delivery_tag = pending_nack.pop(0)
-                self.__spider.processing_tasks.get_task(delivery_tag).nack()
+        """Sends acks and nacks of tasks finalized while connection was not able to interact"""
+        if not self._can_interact or self.__spider is None:
+            return
+        if self.reply_aggregator is not None:
+            self.reply_aggregator.flush()
+        pending_ack = self.pending_relieve["ack"]
+        pending_nack = self.pending_relieve["nack"]
+        if pending_ack:
+            self._ack_pending(pending_ack)
+            pending_ack.clear()
+        while pending_nack:
+            _delivery_tag, pending_task = pending_nack.popitem(last=False)
+            pending_task.nack()
+
+    def _ack_pending(self, pending_ack):
+        """Acks pending tasks one by one within single ioloop callback. Multiple ack is not used:
+        lower deliveries may still wait for reply publishing, dedup lookup or leader task"""
+        if self.rmq_connection is None or not isinstance(
+            self.rmq_connection.connection, pika.SelectConnection
+        ):
+            return
+        self.rmq_connection.connection.ioloop.add_callback_threadsafe(
+            functools.partial(
+                self.rmq_connection.acknowledge_messages, delivery_tags=list(pending_ack)
+            )
+        )
 
     def on_basic_get_message(self, message):
+        if self._is_draining:
+            """Delivered before consumers cancellation, requeued on spider_closed"""
+            return
         delivery_tag = message.get("method").delivery_tag
         ack_cb = nack_cb = None
         if isinstance(self.rmq_connection.connection, pika.SelectConnection):
@@ -421,32 +798,194 @@ class RPCTaskConsumer(object):
                 functools.partial(
                     self.rmq_connection.connection.ioloop.add_callback_threadsafe,
                     functools.partial(
-                        self.rmq_connection.negative_acknowledge_message, delivery_tag=delivery_tag
+                        self.rmq_connection.reject_message,
+                        delivery_tag=delivery_tag,
+                        # raw body is kept only if it could be republished to retry queue
+                        body=message.get("body")
+                        if self.rmq_connection.options.get("dead_letter_enabled", False)
+                        else None,
+                        properties=message.get("properties"),
+                        queue_name=message.get("queue"),
                     ),
                 )
             )
+        message_key = None
+        if (
+            self.deduplicator is not None
+            or self.journal is not None
+            or self.coalesce_key is not None
+        ):
+            message_key = MessageDeduplicator.get_message_key(message)
+        if (
+            self.journal is not None
+            and message.get("method").redelivered
+            and self.journal.is_completed(message_key)
+        ):
+            self._skip_completed_task(message, ack_cb, nack_cb, message_key)
+            return
+        if self.deduplicator is not None:
+            d = self.deduplicator.is_processed(message_key, message.get("method").redelivered)
+            d.addErrback(self._on_dedup_lookup_failure)
+            d.addCallback(self._on_dedup_lookup, message, ack_cb, nack_cb, message_key)
+            return
+        self._accept_task(message, ack_cb, nack_cb, message_key)
+
+    def _on_dedup_lookup(self, is_processed, message, ack_cb, nack_cb, message_key):
+        if message.get("method").redelivered:
+            self._update_dedup_stats(is_processed)
+        if is_processed:
+            logger.info(f"Task {message_key} is already processed, acking")
+            if callable(ack_cb):
+                ack_cb()
+            self._can_get_next_message = True
+            return
+        if self._is_draining:
+            # Spider was closed while message was looked up in persistent store
+            return
+        self._accept_task(message, ack_cb, nack_cb, message_key)
+
+    def _on_dedup_lookup_failure(self, failure):
+        failure.trap(Exception)
+        logger.error(f"Dedup lookup failure: {failure}")
+        return False
+
+    def _build_task(self, message, ack_cb, nack_cb, message_key):
         rmq_task = Task(message, ack_cb, nack_cb)
+        rmq_task.message_key = message_key
+        if self.task_queues and rmq_task.source_queue is not None and rmq_task.reply_to is None:
+            rmq_task.reply_to = self.task_queues.get(rmq_task.source_queue, {}).get("reply_to")
+        return rmq_task
+
+    def _skip_completed_task(self, message, ack_cb, nack_cb, message_key):
+        """Redelivered task completed according to journal is replied again with status it was
+        completed with (ack of previous delivery or reply itself could be lost) and acked"""
+        logger.info(f"Task {message_key} is completed according to journal, acking")
+        self.crawler.stats.inc_value("rmq/journal/skipped_count", spider=self.__spider)
+        self._can_get_next_message = True
+        rmq_task = self._build_task(message, ack_cb, nack_cb, message_key)
+        if rmq_task.reply_to is None or self.reply_aggregator is None:
+            self._settle_task(rmq_task, True)
+            return
+        status = self.journal.get_completed_status(message_key)
+        self.reply_aggregator.add(
+            rmq_task.reply_to,
+            {
+                **rmq_task.payload,
+                "status": status if status is not None else TaskStatusCodes.SUCCESS,
+            },
+            on_published=functools.partial(self._settle_task, rmq_task, True),
+        )
+
+    def _accept_task(self, message, ack_cb, nack_cb, message_key):
+        delivery_tag = message.get("method").delivery_tag
+        rmq_task = self._build_task(message, ack_cb, nack_cb, message_key)
+        if self.task_queues and rmq_task.source_queue is not None:
+            self.crawler.stats.inc_value(
+                f"rmq/queue/{rmq_task.source_queue}/received_count", spider=self.__spider
+            )
+        if self.coalesce_key is not None and self._coalesce(rmq_task):
+            self._can_get_next_message = True
+            return
         self.__spider.processing_tasks.add_task(rmq_task)
+        if self.journal is not None:
+            self.journal.task_received(message_key)
+        self.watchdog.watch(rmq_task)
         # logger.debug(message["body"])
         # logger.critical(message)
         self._can_get_next_message = True
+        spider_next_requests = getattr(self.__spider, "next_requests", None)
         spider_next_request = getattr(self.__spider, "next_request", None)
-        if callable(spider_next_request):
+        if callable(spider_next_requests):
+            self._crawl_sub_tasks(
+                rmq_task, spider_next_requests(delivery_tag, message.get("body"))
+            )
+        elif callable(spider_next_request):
             prepared_request = self.__spider.next_request(delivery_tag, message.get("body"))
             if isinstance(prepared_request, scrapy.Request):
-                prepared_request_meta = deepcopy(prepared_request.meta)
-                should_replace_meta = False
-                if self.delivery_tag_meta_key not in prepared_request_meta.keys():
-                    prepared_request_meta[self.delivery_tag_meta_key] = delivery_tag
-                    should_replace_meta = True
-                if self.msg_body_meta_key not in prepared_request_meta.keys():
-                    prepared_request_meta[self.msg_body_meta_key] = json.loads(message.get("body"))
-                    should_replace_meta = True
-                if should_replace_meta:
-                    prepared_request = prepared_request.replace(meta=prepared_request_meta)
-                if prepared_request.dont_filter is False:
-                    prepared_request = prepared_request.replace(dont_filter=True)
+                self._enrich_request(prepared_request, rmq_task)
             self.crawler.engine.crawl(prepared_request, spider=self.__spider)
+        self._throttle_consuming()
+
+    def _crawl_sub_tasks(self, rmq_task, requests):
+        """Fan-out task: each request returned by spider next_requests is separate sub-task.
+        Message is acked when all sub-tasks are finished"""
+        rmq_task.sub_tasks = {}
+        sub_tasks_count = 0
+        """Completion is not checked until all sub-tasks are scheduled"""
+        self._expanding_task = rmq_task
+        try:
+            for prepared_request in requests or ():
+                if not isinstance(prepared_request, scrapy.Request):
+                    continue
+                self._enrich_request(prepared_request, rmq_task)
+                prepared_request.meta.setdefault(self.sub_task_meta_key, sub_tasks_count)
+                sub_tasks_count += 1
+                self.crawler.engine.crawl(prepared_request, spider=self.__spider)
+        finally:
+            self._expanding_task = None
+        if sub_tasks_count == 0:
+            logger.warning(f"Task {rmq_task.delivery_tag} has no sub-tasks")
+            rmq_task.status = TaskStatusCodes.SUCCESS
+            self._finalize_task(self.__spider, rmq_task)
+        else:
+            self._check_is_completed(self.__spider, rmq_task.delivery_tag)
+
+    def _enrich_request(self, request, rmq_task):
+        """Injects delivery tag and decoded task payload into request meta in place, without
+        copying. Payload is shared with the task by reference and must not be mutated"""
+        meta = request.meta
+        if self.delivery_tag_meta_key not in meta:
+            meta[self.delivery_tag_meta_key] = rmq_task.delivery_tag
+        if self.msg_body_meta_key not in meta:
+            meta[self.msg_body_meta_key] = rmq_task.payload
+        if rmq_task.priority:
+            """AMQP message priority raises priority of task requests in scrapy scheduler"""
+            meta[RMQConstants.PRIORITY_META_KEY.value] = rmq_task.priority
+            request.priority += rmq_task.priority
+        if self.journal is not None:
+            """Counters of previous (interrupted) processing of the same task"""
+            checkpoint = self.journal.get_checkpoint(rmq_task.message_key)
+            if checkpoint is not None:
+                meta.setdefault(RMQConstants.CHECKPOINT_META_KEY.value, checkpoint)
+        request.dont_filter = True
+        return request
+
+    def get_scheduler_backlog(self):
+        """Number of requests waiting in scheduler plus requests being downloaded"""
+        engine = self.crawler.engine
+        if engine is None:
+            return 0
+        slot = getattr(engine, "slot", None) or getattr(engine, "_slot", None)
+        if slot is None:
+            return 0
+        return len(slot.scheduler) + len(engine.downloader.active)
+
+    def _throttle_consuming(self):
+        if self.scheduler_threshold == 0 or not self._can_interact or self._is_draining:
+            return
+        if not isinstance(self.rmq_connection.connection, pika.SelectConnection):
+            return
+        backlog = self.get_scheduler_backlog()
+        if not self._is_consuming_paused and backlog >= self.scheduler_threshold:
+            self._is_consuming_paused = True
+            logger.info(f"Scheduler backlog {backlog} reached threshold, pausing consuming")
+            self.crawler.stats.inc_value("rmq/consumer/pause_count", spider=self.__spider)
+            self.rmq_connection.connection.ioloop.add_callback_threadsafe(
+                self.rmq_connection.pause_consuming
+            )
+        elif self._is_consuming_paused and backlog <= self.scheduler_low_watermark:
+            self._is_consuming_paused = False
+            logger.info(f"Scheduler backlog {backlog} drained, resuming consuming")
+            self.rmq_connection.connection.ioloop.add_callback_threadsafe(
+                self.rmq_connection.resume_consuming
+            )
+
+    def _update_dedup_stats(self, is_processed):
+        stats = self.crawler.stats
+        stats.inc_value("rmq/dedup/lookups", spider=self.__spider)
+        if is_processed:
+            stats.inc_value("rmq/dedup/hits", spider=self.__spider)
+        stats.set_value("rmq/dedup/hit_ratio", self.deduplicator.hit_ratio(), spider=self.__spider)
 
     def on_message_consumed(self, message):
         self.on_basic_get_message(message)
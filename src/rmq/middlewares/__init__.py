@@ -1,2 +1,3 @@
 from .delivery_tag_spider_middleware import DeliveryTagSpiderMiddleware
+from .rmq_spider_middleware import RMQSpiderMiddleware
 from .task_toss_spider_middleware import TaskTossSpiderMiddleware
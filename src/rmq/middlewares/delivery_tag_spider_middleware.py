@@ -1,17 +1,17 @@
-from rmq.items import RMQItem
-from rmq.utils import RMQConstants
+import warnings
 
+from scrapy.exceptions import ScrapyDeprecationWarning
 
-class DeliveryTagSpiderMiddleware:
-    def process_spider_output(self, response, result, spider):
-        delivery_tag_key = RMQConstants.DELIVERY_TAG_META_KEY.value
-        for result_item in result:
-            if isinstance(result_item, RMQItem):
-                response_delivery_tag = response.meta.get(delivery_tag_key, None)
-                if response_delivery_tag is not None and (
-                    delivery_tag_key not in result_item.keys()
-                    or result_item[delivery_tag_key] is None
-                    or result_item[delivery_tag_key] == ""
-                ):
-                    result_item[delivery_tag_key] = response_delivery_tag
-            yield result_item
+from .rmq_spider_middleware import RMQSpiderMiddleware
+
+
+class DeliveryTagSpiderMiddleware(RMQSpiderMiddleware):
+    """Deprecated alias of RMQSpiderMiddleware"""
+
+    def __init__(self):
+        warnings.warn(
+            "DeliveryTagSpiderMiddleware is deprecated, use rmq.middlewares.RMQSpiderMiddleware",
+            ScrapyDeprecationWarning,
+            stacklevel=2,
+        )
+        super().__init__()
@@ -0,0 +1,59 @@
+from scrapy import Request
+
+from rmq.items import RMQItem
+from rmq.utils import RMQConstants
+
+
+class RMQSpiderMiddleware:
+    """Propagates task of response to callback output in single pass (replaces
+    TaskTossSpiderMiddleware and DeliveryTagSpiderMiddleware): requests get delivery tag,
+    sub-task index and task priority, RMQ items get delivery tag. Response task is looked up once
+    per callback output, output of responses without task is passed through as is"""
+
+    def __init__(self):
+        self.delivery_tag_key = RMQConstants.DELIVERY_TAG_META_KEY.value
+        self.sub_task_key = RMQConstants.SUB_TASK_META_KEY.value
+        self.priority_key = RMQConstants.PRIORITY_META_KEY.value
+
+    def _get_response_task(self, response):
+        """Returns (delivery tag, sub-task index, priority) of response or None"""
+        meta = response.meta
+        delivery_tag = meta.get(self.delivery_tag_key, None)
+        if delivery_tag is None:
+            return None
+        return delivery_tag, meta.get(self.sub_task_key, None), meta.get(self.priority_key, 0)
+
+    def _propagate(self, result_item, response_task):
+        if isinstance(result_item, Request):
+            meta = result_item.meta
+            if meta.get(self.delivery_tag_key, None) is None:
+                delivery_tag, sub_task, task_priority = response_task
+                meta[self.delivery_tag_key] = delivery_tag
+                if sub_task is not None:
+                    meta[self.sub_task_key] = sub_task
+                if task_priority:
+                    meta[self.priority_key] = task_priority
+                    result_item.priority += task_priority
+        elif isinstance(result_item, RMQItem):
+            if result_item.get(self.delivery_tag_key, None) in (None, ""):
+                result_item[self.delivery_tag_key] = response_task[0]
+        return result_item
+
+    def _process_output(self, result, response_task):
+        for result_item in result:
+            yield self._propagate(result_item, response_task)
+
+    def process_spider_output(self, response, result, spider):
+        response_task = self._get_response_task(response)
+        if response_task is None:
+            return result
+        return self._process_output(result, response_task)
+
+    async def process_spider_output_async(self, response, result, spider):
+        response_task = self._get_response_task(response)
+        if response_task is None:
+            async for result_item in result:
+                yield result_item
+        else:
+            async for result_item in result:
+                yield self._propagate(result_item, response_task)
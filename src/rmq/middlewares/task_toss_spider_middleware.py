@@ -1,15 +1,17 @@
-from scrapy import Request
+import warnings
 
-from rmq.utils import RMQConstants
+from scrapy.exceptions import ScrapyDeprecationWarning
 
+from .rmq_spider_middleware import RMQSpiderMiddleware
 
-class TaskTossSpiderMiddleware:
-    def process_spider_output(self, response, result, spider):
-        delivery_tag_key = RMQConstants.DELIVERY_TAG_META_KEY.value
-        for result_item in result:
-            if isinstance(result_item, Request):
-                response_delivery_tag = response.meta.get(delivery_tag_key, None)
-                request_delivery_tag = result_item.meta.get(delivery_tag_key, None)
-                if response_delivery_tag is not None and request_delivery_tag is None:
-                    result_item.meta[delivery_tag_key] = response_delivery_tag
-            yield result_item
+
+class TaskTossSpiderMiddleware(RMQSpiderMiddleware):
+    """Deprecated alias of RMQSpiderMiddleware"""
+
+    def __init__(self):
+        warnings.warn(
+            "TaskTossSpiderMiddleware is deprecated, use rmq.middlewares.RMQSpiderMiddleware",
+            ScrapyDeprecationWarning,
+            stacklevel=2,
+        )
+        super().__init__()
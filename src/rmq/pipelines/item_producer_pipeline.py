@@ -81,22 +81,15 @@ class ItemProducerPipeline:
     def spider_closed(self, spider):
         if self.rmq_connection is not None:
             while len(self.pending_items_buffer) and self._can_interact:
-                self.send_message(self.pending_items_buffer.pop(0))
+                self.send_message(*self.pending_items_buffer.pop(0))
             if isinstance(self.rmq_connection.connection, pika.SelectConnection):
                 self.rmq_connection.connection.ioloop.add_callback_threadsafe(
                     self.rmq_connection.stop
                 )
 
     def _validate_spider_has_attributes(self):
-        spider_attributes = [
-            attr for attr in dir(self.__spider) if not callable(getattr(self.__spider, attr))
-        ]
-        if "result_queue_name" not in spider_attributes:
-            return False
-        if (
-            not isinstance(self.__spider.result_queue_name, str)
-            or len(self.__spider.result_queue_name) == 0
-        ):
+        result_queue_name = getattr(self.__spider, "result_queue_name", None)
+        if not isinstance(result_queue_name, str) or len(result_queue_name) == 0:
             return False
         return True
 
@@ -127,24 +120,51 @@ class ItemProducerPipeline:
         )
         c.run()
 
-    def send_message(self, item):
+    def send_message(self, item, correlation_id=None):
         """Sends message to rabbitmq"""
         if isinstance(self.rmq_connection.connection, pika.SelectConnection):
             item_as_dictionary = dict(item)
             if self.delivery_tag_meta_key in item_as_dictionary:
                 del item_as_dictionary[self.delivery_tag_meta_key]
+            properties = None
+            if correlation_id is not None:
+                properties = pika.BasicProperties(
+                    content_type="application/json",
+                    delivery_mode=2,
+                    correlation_id=correlation_id,
+                )
             cb = functools.partial(
-                self.rmq_connection.publish_message, message=json.dumps(item_as_dictionary)
+                self.rmq_connection.publish_message,
+                message=json.dumps(item_as_dictionary),
+                properties=properties,
             )
             self.rmq_connection.connection.ioloop.add_callback_threadsafe(cb)
 
+    def _get_correlation_ids(self, item, spider):
+        """Item of task with coalesced duplicates (see RMQ_COALESCE_KEY) is published once
+        for each of them, as if every duplicate was crawled separately. Every copy is tagged
+        with correlation_id of its task message (or message key if publisher set none).
+        Duplicates are attached only before the task produces its first item"""
+        processing_tasks = getattr(spider, "processing_tasks", None)
+        delivery_tag = item.get(self.delivery_tag_meta_key, None)
+        if delivery_tag is None or processing_tasks is None:
+            return [None]
+        current_task = processing_tasks.get_task(delivery_tag)
+        if current_task is None or not current_task.followers:
+            return [None]
+        return [
+            task.correlation_id or task.message_key
+            for task in (current_task, *current_task.followers)
+        ]
+
     def process_item(self, item, spider):
         """Invoked when item is processed"""
         if isinstance(item, RMQItem):
-            if self._can_interact:
-                while len(self.pending_items_buffer):
-                    self.send_message(self.pending_items_buffer.pop(0))
-                self.send_message(item)
-            else:
-                self.pending_items_buffer.append(item)
+            for correlation_id in self._get_correlation_ids(item, spider):
+                if self._can_interact:
+                    while len(self.pending_items_buffer):
+                        self.send_message(*self.pending_items_buffer.pop(0))
+                    self.send_message(item, correlation_id)
+                else:
+                    self.pending_items_buffer.append((item, correlation_id))
         return item
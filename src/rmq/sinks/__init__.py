@@ -0,0 +1,3 @@
+from .base_sink import BaseSink
+from .json_lines_sink import JsonLinesSink
+from .parquet_sink import ParquetSink
@@ -0,0 +1,74 @@
+import os
+import time
+
+
+class BaseSink:
+    """Buffers rows in columnar form and writes them to files in large batches.
+
+    Buffer is detached in reactor thread with take_batch() and written with write_batch(),
+    which is allowed to block (should be called in thread pool). Data must be durable (fsynced)
+    when write_batch() returns
+    """
+
+    def __init__(self, directory, file_prefix="part", batch_size=10000, flush_interval=60):
+        self.directory = directory
+        self.file_prefix = file_prefix
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+
+        self.columns = {}
+        self.rows_count = 0
+        self.buffer_started_at = None
+        self.files_count = 0
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def add(self, row: dict):
+        if self.rows_count == 0:
+            self.buffer_started_at = time.time()
+        for column in row.keys() - self.columns.keys():
+            self.columns[column] = [None] * self.rows_count
+        for column, values in self.columns.items():
+            values.append(row.get(column, None))
+        self.rows_count += 1
+
+    def is_empty(self):
+        return self.rows_count == 0
+
+    def is_flush_required(self):
+        if self.rows_count >= self.batch_size:
+            return True
+        return (
+            self.rows_count > 0
+            and self.flush_interval
+            and time.time() - self.buffer_started_at >= self.flush_interval
+        )
+
+    def take_batch(self):
+        columns, rows_count = self.columns, self.rows_count
+        self.columns = {}
+        self.rows_count = 0
+        self.buffer_started_at = None
+        return columns, rows_count
+
+    def build_file_path(self, extension):
+        self.files_count += 1
+        file_name = "{}-{}-{}-{:06d}.{}".format(
+            self.file_prefix,
+            time.strftime("%Y%m%d%H%M%S"),
+            os.getpid(),
+            self.files_count,
+            extension,
+        )
+        return os.path.join(self.directory, file_name)
+
+    @staticmethod
+    def fsync(file_object):
+        file_object.flush()
+        os.fsync(file_object.fileno())
+
+    def write_batch(self, columns, rows_count):
+        raise NotImplementedError
+
+    def close(self):
+        pass
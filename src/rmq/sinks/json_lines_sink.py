@@ -0,0 +1,60 @@
+import gzip
+import json
+import os
+
+from .base_sink import BaseSink
+
+
+class JsonLinesSink(BaseSink):
+    """Writes gzip compressed JSON lines. File is rotated after max_file_rows rows,
+    until rotation it has .part suffix"""
+
+    _EXTENSION = "jsonl.gz"
+    _PART_SUFFIX = ".part"
+
+    def __init__(self, directory, max_file_rows=1000000, compression_level=6, **kwargs):
+        super().__init__(directory, **kwargs)
+        self.max_file_rows = max_file_rows
+        self.compression_level = compression_level
+
+        self.file_path = None
+        self.file_rows_count = 0
+        self._raw_file = None
+        self._gzip_file = None
+
+    def _open_file(self):
+        self.file_path = self.build_file_path(self._EXTENSION)
+        self.file_rows_count = 0
+        self._raw_file = open(self.file_path + self._PART_SUFFIX, "wb")
+        self._gzip_file = gzip.GzipFile(
+            fileobj=self._raw_file, mode="wb", compresslevel=self.compression_level
+        )
+
+    def _rotate_file(self):
+        if self._gzip_file is None:
+            return
+        self._gzip_file.close()
+        self.fsync(self._raw_file)
+        self._raw_file.close()
+        os.rename(self.file_path + self._PART_SUFFIX, self.file_path)
+        self._gzip_file = self._raw_file = None
+
+    def write_batch(self, columns, rows_count):
+        if self._gzip_file is None:
+            self._open_file()
+        names = list(columns.keys())
+        values = [columns[name] for name in names]
+        lines = []
+        for row in zip(*values):
+            lines.append(json.dumps(dict(zip(names, row)), ensure_ascii=False))
+        lines.append("")
+        self._gzip_file.write("\n".join(lines).encode("utf-8"))
+        """Sync flush completes deflate block, so all written rows are readable from the file"""
+        self._gzip_file.flush()
+        self.fsync(self._raw_file)
+        self.file_rows_count += rows_count
+        if self.file_rows_count >= self.max_file_rows:
+            self._rotate_file()
+
+    def close(self):
+        self._rotate_file()
@@ -0,0 +1,30 @@
+import os
+
+from .base_sink import BaseSink
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+
+class ParquetSink(BaseSink):
+    """Writes every batch into separate parquet file. Requires pyarrow package"""
+
+    _EXTENSION = "parquet"
+    _PART_SUFFIX = ".part"
+
+    def __init__(self, directory, compression="zstd", **kwargs):
+        if pyarrow is None:
+            raise RuntimeError("pyarrow package must be installed to use ParquetSink")
+        super().__init__(directory, **kwargs)
+        self.compression = compression
+
+    def write_batch(self, columns, rows_count):
+        file_path = self.build_file_path(self._EXTENSION)
+        table = pyarrow.Table.from_pydict(columns)
+        with open(file_path + self._PART_SUFFIX, "wb") as f:
+            pyarrow.parquet.write_table(table, f, compression=self.compression)
+            self.fsync(f)
+        os.rename(file_path + self._PART_SUFFIX, file_path)
@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 from rmq.extensions import RPCTaskConsumer
-from rmq.middlewares import DeliveryTagSpiderMiddleware, TaskTossSpiderMiddleware
+from rmq.middlewares import RMQSpiderMiddleware
 from rmq.spiders import HttpbinSpider
 from rmq.utils import get_import_full_name
 
@@ -9,8 +9,7 @@ class TaskBaseSpider(HttpbinSpider):
     @classmethod
     def update_settings(cls, settings):
         spider_middlewares = settings.getdict("SPIDER_MIDDLEWARES")
-        spider_middlewares[get_import_full_name(TaskTossSpiderMiddleware)] = 140
-        spider_middlewares[get_import_full_name(DeliveryTagSpiderMiddleware)] = 150
+        spider_middlewares[get_import_full_name(RMQSpiderMiddleware)] = 140
 
         spider_extensions = settings.getdict("EXTENSIONS")
         spider_extensions[get_import_full_name(RPCTaskConsumer)] = 20
@@ -1,6 +1,16 @@
 from .constants import RMQConstants
+from .hardware_errors import HARDWARE_ERRORS, is_hardware_error, is_hardware_error_status
 from .import_full_name import get_import_full_name
+from .lru_ttl_cache import LRUTTLCache
+from .message_deduplicator import MessageDeduplicator
+from .prefetch_auto_tuner import PrefetchAutoTuner
+from .process_offloader import ProcessOffloader
+from .queue_options import get_queue_options
+from .reply_aggregator import ReplyAggregator
 from .rmq_default_options import RMQDefaultOptions
+from .sql_dedup_store import SQLDedupStore
 from .task import Task
+from .task_journal import TaskJournal
 from .task_observer import TaskObserver
 from .task_status_codes import TaskStatusCodes
+from .task_watchdog import TaskWatchdog
@@ -4,3 +4,8 @@ from enum import Enum
 class RMQConstants(Enum):
     DELIVERY_TAG_META_KEY = "delivery_tag"
     MSG_BODY_META_KEY = "msg_body"
+    CHECKPOINT_META_KEY = "rmq_checkpoint"
+    SUB_TASK_META_KEY = "rmq_sub_task"
+    PRIORITY_META_KEY = "rmq_priority"
+    ATTEMPTS_HEADER = "x-rmq-attempts"
+    REPLY_BATCH_SIZE_HEADER = "x-rmq-batch-size"
@@ -1,4 +1,5 @@
 from .call_once import call_once
 from .log_current_thread import log_current_thread
+from .process_offload import process_offload
 from .rmq_callback import rmq_callback
 from .rmq_errback import rmq_errback
@@ -0,0 +1,69 @@
+from weakref import WeakKeyDictionary
+
+REGISTRY_ATTRIBUTE = "__rmq_decorated_methods__"
+
+_resolved_registries = WeakKeyDictionary()
+
+
+class _DecoratedMethodRegistration:
+    # Placeholder returned by rmq decorators for class body: on owner class creation it records
+    # method name in class registry and replaces itself with the decorated function. Used outside
+    # of class body it acts as the function itself
+    __slots__ = ("func",)
+
+    def __init__(self, func):
+        self.func = func
+
+    def __set_name__(self, owner, name):
+        registry = owner.__dict__.get(REGISTRY_ATTRIBUTE, None)
+        if registry is None:
+            registry = {}
+            setattr(owner, REGISTRY_ATTRIBUTE, registry)
+        registry[name] = self.func.__decorator_name__
+        setattr(owner, name, self.func)
+
+    def __get__(self, instance, owner=None):
+        return self.func.__get__(instance, owner)
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def __getattr__(self, item):
+        return getattr(self.func, item)
+
+
+def register_decorated_method(func):
+    """Registers decorated method in its class registry at class definition time"""
+    return _DecoratedMethodRegistration(func)
+
+
+def _get_class_decorated_methods(klass):
+    """Registry of class completed with scan of its attributes: decorator stacked above rmq
+    decorator hides registration placeholder, its wrapper (functools.wraps) keeps the marks"""
+    methods = dict(klass.__dict__.get(REGISTRY_ATTRIBUTE, {}))
+    for name, value in list(klass.__dict__.items()):
+        if name in methods or name.startswith("__"):
+            continue
+        decorator_name = getattr(value, "__decorator_name__", None)
+        if isinstance(decorator_name, str) and hasattr(value, "__wrapped__"):
+            methods[name] = decorator_name
+    return methods
+
+
+def get_decorated_methods(klass):
+    """Returns {method name: decorator name} of decorated methods of class and its bases.
+    Method overridden without decorator in subclass is skipped. Result is cached per class"""
+    methods = _resolved_registries.get(klass, None)
+    if methods is not None:
+        return methods
+    methods = {}
+    mro = klass.__mro__
+    for base in mro:
+        for name, decorator_name in _get_class_decorated_methods(base).items():
+            if name in methods:
+                continue
+            owner = next(cls for cls in mro if name in cls.__dict__)
+            if owner is base:
+                methods[name] = decorator_name
+    _resolved_registries[klass] = methods
+    return methods
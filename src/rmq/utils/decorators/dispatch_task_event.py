@@ -0,0 +1,15 @@
+def dispatch_task_event(spider, signal, **kwargs):
+    """Delivers task event produced by rmq decorators.
+
+    If spider task observer has registered listener (direct dispatch mode), event is passed to it
+    with plain method call and the signal is sent only when it has receivers besides the listener.
+    Otherwise the signal is sent as usual
+    """
+    processing_tasks = getattr(spider, "processing_tasks", None)
+    get_listener = getattr(processing_tasks, "get_listener", None)
+    listener = get_listener() if get_listener is not None else None
+    if listener is not None:
+        listener.on_task_event(signal, spider=spider, **kwargs)
+        if not listener.has_external_receivers(signal):
+            return
+    spider.crawler.signals.send_catch_log(signal=signal, spider=spider, **kwargs)
@@ -0,0 +1,21 @@
+import functools
+
+from rmq.utils.process_offloader import ProcessOffloader
+
+
+def process_offload(func):
+    """Decorated function is run in ProcessOffloader process pool (RMQ_PROCESS_POOL_SIZE).
+    It must be module or class level function taking response as first argument, call of
+    decorated function returns awaitable of list of its results. It is run inline if offloading
+    is disabled.
+
+    Usage from async rmq_callback (task accounting is done after awaited results are yielded):
+        for item in await extract_items(response):
+            yield item
+    """
+
+    @functools.wraps(func)
+    def wrapper(response, *args, **kwargs):
+        return ProcessOffloader.offload(func, response, *args, **kwargs)
+
+    return wrapper
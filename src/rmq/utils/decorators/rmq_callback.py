@@ -2,12 +2,69 @@ import functools
 import inspect
 
 import scrapy
+from scrapy.utils.misc import arg_to_iter
 
 from rmq.signals import callback_completed, item_scheduled
 from rmq.utils import RMQConstants
+from rmq.utils.decorators.decorated_methods_registry import register_decorated_method
+from rmq.utils.decorators.dispatch_task_event import dispatch_task_event
+
+
+def _get_event_kwargs(spider, args):
+    """Returns task events kwargs of callback call, None if call is not related to task"""
+    if not isinstance(spider, scrapy.Spider):
+        return None
+    if len(args) == 0:
+        return {}
+    response = args[0]
+    if not isinstance(response, scrapy.http.Response):
+        return None
+    return {
+        "response": response,
+        "delivery_tag": response.meta.get(RMQConstants.DELIVERY_TAG_META_KEY.value, None),
+    }
+
+
+def _async_rmq_callback(callback_method):
+    """Task accounting of async def callbacks and async generator callbacks"""
+    if inspect.isasyncgenfunction(callback_method):
+
+        @functools.wraps(callback_method)
+        async def wrapper(self, *args, **kwargs):
+            event_kwargs = _get_event_kwargs(self, args)
+            async for callback_result_item in callback_method(self, *args, **kwargs):
+                if event_kwargs is not None and isinstance(callback_result_item, scrapy.Item):
+                    dispatch_task_event(self, item_scheduled, **event_kwargs)
+                yield callback_result_item
+            if event_kwargs is not None:
+                dispatch_task_event(self, callback_completed, **event_kwargs)
+
+    else:
+
+        @functools.wraps(callback_method)
+        async def wrapper(self, *args, **kwargs):
+            event_kwargs = _get_event_kwargs(self, args)
+            callback_result = await callback_method(self, *args, **kwargs)
+            # Single item or request returned by coroutine is accepted by scrapy as well
+            callback_result = list(arg_to_iter(callback_result))
+            if event_kwargs is not None:
+                for callback_result_item in callback_result:
+                    if isinstance(callback_result_item, scrapy.Item):
+                        dispatch_task_event(self, item_scheduled, **event_kwargs)
+                dispatch_task_event(self, callback_completed, **event_kwargs)
+            return callback_result
+
+    return wrapper
 
 
 def rmq_callback(callback_method):
+    if inspect.iscoroutinefunction(callback_method) or inspect.isasyncgenfunction(
+        callback_method
+    ):
+        wrapper = _async_rmq_callback(callback_method)
+        wrapper.__decorator_name__ = inspect.currentframe().f_code.co_name
+        return register_decorated_method(wrapper)
+
     @functools.wraps(callback_method)
     def wrapper(self, *args, **kwargs):
         delivery_tag_meta_key = RMQConstants.DELIVERY_TAG_META_KEY.value
@@ -21,19 +78,19 @@ def rmq_callback(callback_method):
                         iter(callback_result)
                         for callback_result_item in callback_result:
                             if isinstance(callback_result_item, scrapy.Item):
-                                self.crawler.signals.send_catch_log(
-                                    signal=item_scheduled,
+                                dispatch_task_event(
+                                    self,
+                                    item_scheduled,
                                     response=response,
-                                    spider=self,
                                     delivery_tag=delivery_tag,
                                 )
                             yield callback_result_item
                     except TypeError:
                         pass
-                    self.crawler.signals.send_catch_log(
-                        signal=callback_completed,
+                    dispatch_task_event(
+                        self,
+                        callback_completed,
                         response=response,
-                        spider=self,
                         delivery_tag=delivery_tag,
                     )
             else:
@@ -41,11 +98,11 @@ def rmq_callback(callback_method):
                     iter(callback_result)
                     for callback_result_item in callback_result:
                         if isinstance(callback_result_item, scrapy.Item):
-                            self.crawler.signals.send_catch_log(signal=item_scheduled, spider=self)
+                            dispatch_task_event(self, item_scheduled)
                         yield callback_result_item
                 except TypeError:
                     pass
-                self.crawler.signals.send_catch_log(signal=callback_completed, spider=self)
+                dispatch_task_event(self, callback_completed)
         else:
             try:
                 iter(callback_result)
@@ -54,4 +111,4 @@ def rmq_callback(callback_method):
                 pass
 
     wrapper.__decorator_name__ = inspect.currentframe().f_code.co_name
-    return wrapper
+    return register_decorated_method(wrapper)
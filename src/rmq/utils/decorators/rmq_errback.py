@@ -2,13 +2,69 @@ import functools
 import inspect
 
 import scrapy
+from scrapy.utils.misc import arg_to_iter
 from twisted.python.failure import Failure
 
 from rmq.signals import errback_completed, item_scheduled
 from rmq.utils import RMQConstants
+from rmq.utils.decorators.decorated_methods_registry import register_decorated_method
+from rmq.utils.decorators.dispatch_task_event import dispatch_task_event
+
+
+def _get_event_kwargs(spider, args):
+    """Returns task events kwargs of errback call, None if call is not related to task"""
+    if not isinstance(spider, scrapy.Spider) or len(args) == 0:
+        return None
+    delivery_tag_meta_key = RMQConstants.DELIVERY_TAG_META_KEY.value
+    response = args[0]
+    if isinstance(response, scrapy.http.Response):
+        return {"response": response, "delivery_tag": response.meta.get(delivery_tag_meta_key)}
+    if isinstance(response, Failure) and hasattr(response, "request"):
+        return {
+            "failure": response,
+            "delivery_tag": response.request.meta.get(delivery_tag_meta_key, None),
+        }
+    return None
+
+
+def _async_rmq_errback(errback_method):
+    """Task accounting of async def errbacks and async generator errbacks"""
+    if inspect.isasyncgenfunction(errback_method):
+
+        @functools.wraps(errback_method)
+        async def wrapper(self, *args, **kwargs):
+            event_kwargs = _get_event_kwargs(self, args)
+            async for errback_result_item in errback_method(self, *args, **kwargs):
+                if event_kwargs is not None and isinstance(errback_result_item, scrapy.Item):
+                    dispatch_task_event(self, item_scheduled, **event_kwargs)
+                yield errback_result_item
+            if event_kwargs is not None:
+                dispatch_task_event(self, errback_completed, **event_kwargs)
+
+    else:
+
+        @functools.wraps(errback_method)
+        async def wrapper(self, *args, **kwargs):
+            event_kwargs = _get_event_kwargs(self, args)
+            errback_result = await errback_method(self, *args, **kwargs)
+            # Single item or request returned by coroutine is accepted by scrapy as well
+            errback_result = list(arg_to_iter(errback_result))
+            if event_kwargs is not None:
+                for errback_result_item in errback_result:
+                    if isinstance(errback_result_item, scrapy.Item):
+                        dispatch_task_event(self, item_scheduled, **event_kwargs)
+                dispatch_task_event(self, errback_completed, **event_kwargs)
+            return errback_result
+
+    return wrapper
 
 
 def rmq_errback(errback_method):
+    if inspect.iscoroutinefunction(errback_method) or inspect.isasyncgenfunction(errback_method):
+        wrapper = _async_rmq_errback(errback_method)
+        wrapper.__decorator_name__ = inspect.currentframe().f_code.co_name
+        return register_decorated_method(wrapper)
+
     @functools.wraps(errback_method)
     def wrapper(self, *args, **kwargs):
         delivery_tag_meta_key = RMQConstants.DELIVERY_TAG_META_KEY.value
@@ -22,19 +78,19 @@ def rmq_errback(errback_method):
                         iter(errback_result)
                         for errback_result_item in errback_result:
                             if isinstance(errback_result_item, scrapy.Item):
-                                self.crawler.signals.send_catch_log(
-                                    signal=item_scheduled,
+                                dispatch_task_event(
+                                    self,
+                                    item_scheduled,
                                     response=response,
-                                    spider=self,
                                     delivery_tag=delivery_tag,
                                 )
                             yield errback_result_item
                     except TypeError:
                         pass
-                    self.crawler.signals.send_catch_log(
-                        signal=errback_completed,
+                    dispatch_task_event(
+                        self,
+                        errback_completed,
                         response=response,
-                        spider=self,
                         delivery_tag=delivery_tag,
                     )
                 if isinstance(response, Failure):
@@ -44,19 +100,19 @@ def rmq_errback(errback_method):
                             iter(errback_result)
                             for errback_result_item in errback_result:
                                 if isinstance(errback_result_item, scrapy.Item):
-                                    self.crawler.signals.send_catch_log(
-                                        signal=item_scheduled,
+                                    dispatch_task_event(
+                                        self,
+                                        item_scheduled,
                                         failure=response,
-                                        spider=self,
                                         delivery_tag=delivery_tag,
                                     )
                                 yield errback_result_item
                         except TypeError:
                             pass
-                        self.crawler.signals.send_catch_log(
-                            signal=errback_completed,
+                        dispatch_task_event(
+                            self,
+                            errback_completed,
                             failure=response,
-                            spider=self,
                             delivery_tag=delivery_tag,
                         )
             else:
@@ -67,14 +123,14 @@ def rmq_errback(errback_method):
                             isinstance(errback_result_item, scrapy.Item)
                             and delivery_tag_meta_key in errback_result_item.keys()
                         ):
-                            self.crawler.signals.send_catch_log(
-                                signal=item_scheduled,
-                                spider=self,
+                            dispatch_task_event(
+                                self,
+                                item_scheduled,
                                 delivery_tag=errback_result_item[delivery_tag_meta_key],
                             )
                 except TypeError:
                     pass
-                self.crawler.signals.send_catch_log(signal=errback_completed)
+                dispatch_task_event(self, errback_completed)
         else:
             try:
                 iter(errback_result)
@@ -83,12 +139,13 @@ def rmq_errback(errback_method):
                         isinstance(errback_result_item, scrapy.Item)
                         and delivery_tag_meta_key in errback_result_item.keys()
                     ):
-                        self.crawler.signals.send_catch_log(
-                            signal=item_scheduled,
+                        dispatch_task_event(
+                            self,
+                            item_scheduled,
                             delivery_tag=errback_result_item[delivery_tag_meta_key],
                         )
             except TypeError:
                 pass
 
     wrapper.__decorator_name__ = inspect.currentframe().f_code.co_name
-    return wrapper
+    return register_decorated_method(wrapper)
@@ -0,0 +1,20 @@
+from scrapy.core.downloader.handlers.http11 import TunnelError
+from scrapy.spidermiddlewares.httperror import HttpError
+from twisted.internet.error import DNSLookupError, TCPTimedOutError, TimeoutError
+
+# Failures which mean that target or proxy is not able to serve request (task HARDWARE_ERROR)
+HARDWARE_ERRORS = (HttpError, TunnelError, TimeoutError, TCPTimedOutError, DNSLookupError)
+
+
+def is_hardware_error(error):
+    """Accepts twisted Failure or exception instance"""
+    check = getattr(error, "check", None)
+    if callable(check):
+        return check(*HARDWARE_ERRORS) is not None
+    return isinstance(error, HARDWARE_ERRORS)
+
+
+def is_hardware_error_status(status):
+    """Response status which means that target or proxy is failing or overloaded: 5xx,
+    408 (request timeout) and 429 (too many requests)"""
+    return status >= 500 or status in (408, 429)
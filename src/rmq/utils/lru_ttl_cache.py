@@ -0,0 +1,33 @@
+import time
+from collections import OrderedDict
+
+
+class LRUTTLCache:
+    """Bounded set of keys with per-entry time to live, least recently used keys are evicted first"""
+
+    def __init__(self, max_size=100000, ttl=3600):
+        self.max_size = max(1, int(max_size))
+        self.ttl = ttl
+        self.__entries = OrderedDict()
+
+    def __contains__(self, key):
+        expires_at = self.__entries.get(key, None)
+        if expires_at is None:
+            return False
+        if self.ttl and expires_at < time.time():
+            del self.__entries[key]
+            return False
+        self.__entries.move_to_end(key)
+        return True
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def add(self, key):
+        self.__entries[key] = time.time() + self.ttl if self.ttl else 0
+        self.__entries.move_to_end(key)
+        while len(self.__entries) > self.max_size:
+            self.__entries.popitem(last=False)
+
+    def discard(self, key):
+        self.__entries.pop(key, None)
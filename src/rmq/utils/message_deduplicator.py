@@ -0,0 +1,79 @@
+import hashlib
+
+from scrapy.utils.misc import load_object
+from twisted.internet import defer, reactor, threads
+
+from .lru_ttl_cache import LRUTTLCache
+
+
+class MessageDeduplicator:
+    """Remembers keys of processed messages to ack redelivered duplicates without processing.
+    Key is message_id property if provided by publisher, otherwise hash of message body.
+    Only messages marked as redelivered by broker are looked up: in-memory LRU cache first,
+    then persistent store (if configured) in reactor thread pool
+    """
+
+    def __init__(self, cache: LRUTTLCache, store=None):
+        self.cache = cache
+        self.store = store
+        self.lookups = 0
+        self.hits = 0
+
+    @classmethod
+    def from_settings(cls, settings):
+        if not settings.getbool("RMQ_DEDUP_ENABLED", False):
+            return None
+        ttl = settings.getint("RMQ_DEDUP_TTL", 3600)
+        cache = LRUTTLCache(settings.getint("RMQ_DEDUP_CACHE_SIZE", 100000), ttl)
+        store = None
+        store_url = settings.get("RMQ_DEDUP_STORE_URL", None)
+        if store_url:
+            store_class = load_object(
+                settings.get("RMQ_DEDUP_STORE_CLASS", "rmq.utils.SQLDedupStore")
+            )
+            store = store_class(store_url, ttl)
+        return cls(cache, store)
+
+    @staticmethod
+    def get_message_key(message):
+        message_id = getattr(message.get("properties"), "message_id", None)
+        if message_id:
+            return str(message_id)
+        return hashlib.sha1(message.get("body")).hexdigest()
+
+    def is_processed(self, key, redelivered=False):
+        """Returns deferred firing with True if message was processed. Deferred of message which
+        is not redelivered or found in cache is already fired"""
+        if not redelivered:
+            return defer.succeed(False)
+        self.lookups += 1
+        if key in self.cache:
+            self.hits += 1
+            return defer.succeed(True)
+        if self.store is None:
+            return defer.succeed(False)
+        return threads.deferToThread(self.store.contains, key).addCallback(
+            self._on_store_lookup, key
+        )
+
+    def _on_store_lookup(self, is_processed, key):
+        if is_processed:
+            self.hits += 1
+            self.cache.add(key)
+        return is_processed
+
+    def mark_processed(self, key):
+        if key is None:
+            return
+        self.cache.add(key)
+        if self.store is not None:
+            reactor.callInThread(self.store.add, key)
+
+    def hit_ratio(self):
+        if self.lookups == 0:
+            return 0.0
+        return self.hits / self.lookups
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
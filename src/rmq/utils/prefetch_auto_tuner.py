@@ -0,0 +1,73 @@
+class PrefetchAutoTuner:
+    """Adjusts consumer prefetch count from observed database interaction timings.
+
+    Prefetch grows additively while interaction duration stays close to the best observed
+    baseline and shrinks multiplicatively when messages start waiting for a free pool connection
+    """
+
+    def __init__(
+        self,
+        prefetch_count,
+        min_prefetch_count=1,
+        max_prefetch_count=1000,
+        step=1,
+        latency_tolerance=1.5,
+        max_wait_ratio=1.0,
+        shrink_factor=0.75,
+        smoothing=0.2,
+    ):
+        self.min_prefetch_count = max(1, int(min_prefetch_count))
+        self.max_prefetch_count = max(self.min_prefetch_count, int(max_prefetch_count))
+        self.prefetch_count = self._bound(prefetch_count)
+        self.step = max(1, int(step))
+        self.latency_tolerance = latency_tolerance
+        self.max_wait_ratio = max_wait_ratio
+        self.shrink_factor = shrink_factor
+        self.smoothing = smoothing
+
+        self.latency = None
+        self.baseline_latency = None
+        self.wait_time = 0.0
+        self.samples = 0
+
+    def _bound(self, value):
+        return max(self.min_prefetch_count, min(self.max_prefetch_count, int(value)))
+
+    def _smooth(self, current, value):
+        if current is None:
+            return value
+        return current + self.smoothing * (value - current)
+
+    def record(self, wait_time, latency):
+        """Registers single interaction: time spent waiting for execution and execution time"""
+        self.latency = self._smooth(self.latency, latency)
+        self.wait_time = self._smooth(self.wait_time, wait_time)
+        self.samples += 1
+
+    def adjust(self):
+        """Returns proposed prefetch count or None if it should stay unchanged.
+
+        Proposal is not remembered until it is applied to channel and passed to commit
+        """
+        if self.samples == 0 or self.latency is None:
+            return None
+        self.samples = 0
+        if self.baseline_latency is None or self.latency < self.baseline_latency:
+            self.baseline_latency = self.latency
+
+        if self.wait_time > self.latency * self.max_wait_ratio:
+            prefetch_count = self._bound(self.prefetch_count * self.shrink_factor)
+            # Pool is saturated, forget baseline to let it be re-learned at lower load
+            self.baseline_latency = self.latency
+        elif self.latency <= self.baseline_latency * self.latency_tolerance:
+            prefetch_count = self._bound(self.prefetch_count + self.step)
+        else:
+            prefetch_count = self.prefetch_count
+
+        if prefetch_count == self.prefetch_count:
+            return None
+        return prefetch_count
+
+    def commit(self, prefetch_count):
+        """Remembers prefetch count applied to channel as base of next adjustments"""
+        self.prefetch_count = self._bound(prefetch_count)
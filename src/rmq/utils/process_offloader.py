@@ -0,0 +1,116 @@
+import importlib
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from scrapy.http import HtmlResponse
+from twisted.internet import defer, reactor
+
+try:
+    from scrapy.utils.defer import maybe_deferred_to_future
+except ImportError:
+    # Scrapy < 2.6: deferred is awaited directly (asyncio reactor is not supported)
+    maybe_deferred_to_future = None
+
+
+def _resolve_function(module_name, qualname):
+    target = importlib.import_module(module_name)
+    for name in qualname.split("."):
+        target = getattr(target, name)
+    # Decorated function is replaced with its wrapper in module namespace
+    return getattr(target, "__wrapped__", target)
+
+
+def _as_awaitable(d):
+    if maybe_deferred_to_future is not None:
+        return maybe_deferred_to_future(d)
+    return d
+
+
+def _run_in_worker(module_name, qualname, response_data, body, args, kwargs):
+    response = HtmlResponse(body=body, **response_data)
+    result = _resolve_function(module_name, qualname)(response, *args, **kwargs)
+    return list(result) if result is not None else []
+
+
+class ProcessOffloader:
+    """Runs CPU heavy response processing in process pool.
+
+    Offloaded function receives response rebuilt in worker process (url, status, headers, body
+    and encoding, without request and meta) and must return picklable items/requests. Workers
+    are spawned (not forked from process running reactor threads) on Python 3.7+
+    """
+
+    _START_METHOD = "spawn"
+    _instance = None
+
+    def __init__(self, pool_size=0):
+        self.pool_size = max(0, int(pool_size))
+        self.__executor = None
+
+    @classmethod
+    def from_settings(cls, settings):
+        return cls(pool_size=settings.getint("RMQ_PROCESS_POOL_SIZE", 0))
+
+    @classmethod
+    def get_instance(cls):
+        """Process-wide offloader installed by RPCTaskConsumer, None if offloading is disabled"""
+        return cls._instance
+
+    def is_enabled(self):
+        return self.pool_size > 0
+
+    def start(self):
+        if not self.is_enabled():
+            return
+        if sys.version_info >= (3, 7):
+            self.__executor = ProcessPoolExecutor(
+                max_workers=self.pool_size,
+                mp_context=multiprocessing.get_context(self._START_METHOD),
+            )
+        else:
+            self.__executor = ProcessPoolExecutor(max_workers=self.pool_size)
+        ProcessOffloader._instance = self
+
+    def submit(self, func, response, *args, **kwargs):
+        """Returns awaitable of list of results of func(response, *args, **kwargs)"""
+        d = defer.Deferred()
+        future = self.__executor.submit(
+            _run_in_worker,
+            func.__module__,
+            func.__qualname__,
+            {
+                "url": response.url,
+                "status": response.status,
+                "headers": dict(response.headers),
+                "encoding": getattr(response, "encoding", None) or "utf-8",
+            },
+            response.body,
+            args,
+            kwargs,
+        )
+
+        def on_done(done_future):
+            error = done_future.exception()
+            if error is not None:
+                reactor.callFromThread(d.errback, error)
+            else:
+                reactor.callFromThread(d.callback, done_future.result())
+
+        future.add_done_callback(on_done)
+        return _as_awaitable(d)
+
+    @classmethod
+    def offload(cls, func, response, *args, **kwargs):
+        """Submits func to installed offloader or calls it inline if offloading is disabled"""
+        if cls._instance is not None:
+            return cls._instance.submit(func, response, *args, **kwargs)
+        result = func(response, *args, **kwargs)
+        return _as_awaitable(defer.succeed(list(result) if result is not None else []))
+
+    def close(self):
+        if ProcessOffloader._instance is self:
+            ProcessOffloader._instance = None
+        if self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
@@ -0,0 +1,14 @@
+def get_queue_options(settings):
+    """Builds PikaSelectConnection options related to queue topology from project settings"""
+    options = {}
+    if settings.getbool("RABBITMQ_DEAD_LETTER_ENABLED", False):
+        max_attempts = max(1, settings.getint("RABBITMQ_MAX_ATTEMPTS", 5))
+        base_delay = max(1, settings.getint("RABBITMQ_RETRY_BASE_DELAY", 5))
+        options["dead_letter_enabled"] = True
+        options["max_attempts"] = max_attempts
+        options["retry_delays"] = [base_delay * 2 ** i for i in range(max_attempts - 1)]
+    max_priority = settings.getint("RABBITMQ_MAX_PRIORITY", 0)
+    if max_priority > 0:
+        """Broker supports up to 255 priorities, values up to 10 are recommended"""
+        options["max_priority"] = min(max_priority, 255)
+    return options
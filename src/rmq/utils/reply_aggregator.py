@@ -0,0 +1,76 @@
+import json
+
+from twisted.internet import task
+
+
+class ReplyAggregator:
+    """Groups replies of completed tasks per reply_to queue.
+
+    With batch size 1 every reply is published immediately as a single JSON object (default).
+    Otherwise replies are flushed when batch size is reached or on flush interval and each batch
+    is published as one message holding JSON array of replies (see Consumer command).
+    Publish callback returns False if replies can not be published (e.g. connection is not
+    ready), they are kept and published with next flush
+    """
+
+    def __init__(self, publish_callback, batch_size=1, flush_interval=1.0):
+        self.publish_callback = publish_callback
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = flush_interval
+        self.__batches = {}
+        self.__flush_task = None
+
+    @classmethod
+    def from_settings(cls, settings, publish_callback):
+        return cls(
+            publish_callback,
+            batch_size=settings.getint("RMQ_REPLY_BATCH_SIZE", 1),
+            flush_interval=settings.getfloat("RMQ_REPLY_FLUSH_INTERVAL", 1.0),
+        )
+
+    def is_batching(self):
+        return self.batch_size > 1
+
+    def start(self):
+        if self.is_batching() and self.flush_interval > 0:
+            self.__flush_task = task.LoopingCall(self.flush)
+            self.__flush_task.start(self.flush_interval, now=False)
+
+    def add(self, queue_name, reply, on_published=None):
+        """Reply is serialized immediately, so it is not affected by further payload changes.
+        on_published is called once reply is handed to publish callback (e.g. to ack task)"""
+        message = json.dumps(reply)
+        batch = self.__batches.setdefault(queue_name, [])
+        batch.append((message, on_published))
+        if len(batch) >= self.batch_size:
+            self.flush_queue(queue_name)
+
+    def flush_queue(self, queue_name):
+        batch = self.__batches.pop(queue_name, None)
+        while batch:
+            chunk, batch = batch[: self.batch_size], batch[self.batch_size :]
+            if self.is_batching():
+                message = "[" + ",".join(message for message, _ in chunk) + "]"
+            else:
+                message = chunk[0][0]
+            if self.publish_callback(queue_name, message, len(chunk)) is False:
+                self.__batches[queue_name] = chunk + batch
+                return
+            for _, on_published in chunk:
+                if on_published is not None:
+                    on_published()
+
+    def flush(self):
+        for queue_name in list(self.__batches):
+            self.flush_queue(queue_name)
+
+    def clear(self):
+        """Drops replies which are not published, returns their count"""
+        dropped_count = sum(len(batch) for batch in self.__batches.values())
+        self.__batches = {}
+        return dropped_count
+
+    def close(self):
+        if self.__flush_task is not None and self.__flush_task.running:
+            self.__flush_task.stop()
+        self.flush()
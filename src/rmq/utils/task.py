@@ -1,31 +1,73 @@
 import json
+import os
+import time
 
 from rmq.exceptions import ConsumedDataCorrupted
 
+from .task_status_codes import TaskStatusCodes
+
 
 class Task:
+    """Keeps only values required for task accounting: consumed data (channel, method, properties
+    and raw body) is not referenced after decoding"""
+
+    __slots__ = (
+        "delivery_tag",
+        "reply_to",
+        "correlation_id",
+        "priority",
+        "source_queue",
+        "payload",
+        "message_key",
+        "task_id",
+        "status",
+        "created_at",
+        "last_activity_at",
+        "scheduled_requests",
+        "success_responses",
+        "failed_responses",
+        "scheduled_items",
+        "scraped_items",
+        "dropped_items",
+        "error_items",
+        "sub_tasks",
+        "followers",
+        "__ack_callback",
+        "__nack_callback",
+    )
+
     def __init__(self, consumed_data, ack_callback=None, nack_callback=None):
         if not isinstance(consumed_data, dict):
             raise ConsumedDataCorrupted("Consumed data is not a dict")
-        if consumed_data.get("method", None) is None:
+        method = consumed_data.get("method", None)
+        if method is None:
             raise ConsumedDataCorrupted('Consumed data has no "method" key')
-        if consumed_data.get("properties", None) is None:
+        properties = consumed_data.get("properties", None)
+        if properties is None:
             raise ConsumedDataCorrupted('Consumed data has no "properties" key')
-        if consumed_data.get("body", None) is None:
+        body = consumed_data.get("body", None)
+        if body is None:
             raise ConsumedDataCorrupted('Consumed data has no "body" key')
-        self.__consumed_data = consumed_data
 
-        self.payload = json.loads(self.__consumed_data.get("body"))
-        self.delivery_tag = self.__consumed_data.get("method").delivery_tag
-        self.reply_to = self.__consumed_data.get("properties").reply_to
+        self.payload = json.loads(body)
+        self.delivery_tag = method.delivery_tag
+        self.reply_to = properties.reply_to
+        self.correlation_id = getattr(properties, "correlation_id", None)
+        self.priority = getattr(properties, "priority", None) or 0
+        self.source_queue = consumed_data.get("queue", None)
+        self.message_key = None
+        # random id of this delivery (redelivered message gets new one)
+        self.task_id = os.urandom(16)
         self.status = 1
+        self.created_at = time.monotonic()
+        self.last_activity_at = self.created_at
 
         self.__ack_callback = (
             ack_callback
             if ack_callback is not None and callable(ack_callback)
             else self.__empty_callback
         )
-        self.__nack__callback = (
+        self.__nack_callback = (
             nack_callback
             if nack_callback is not None and callable(nack_callback)
             else self.__empty_callback
@@ -34,13 +76,17 @@ class Task:
         self.scheduled_requests = 0
         self.success_responses = 0
         self.failed_responses = 0
-
         self.scheduled_items = 0
         self.scraped_items = 0
         self.dropped_items = 0
         self.error_items = 0
+        # index -> [scheduled, success, failed] requests of unfinished sub-tasks (fan-out tasks)
+        self.sub_tasks = None
+        # duplicate tasks attached to this one by coalescer, finalized together with it
+        self.followers = None
 
-    def __empty_callback(self):
+    @staticmethod
+    def __empty_callback():
         pass
 
     def __disable_callbacks(self):
@@ -55,42 +101,91 @@ class Task:
         self.__nack_callback()
         self.__disable_callbacks()
 
+    def touch(self):
+        self.last_activity_at = time.monotonic()
+
     def request_scheduled(self):
         self.scheduled_requests += 1
+        self.last_activity_at = time.monotonic()
 
     def success_response_received(self):
         self.success_responses += 1
+        self.last_activity_at = time.monotonic()
 
     def fail_response_received(self):
         self.failed_responses += 1
+        self.last_activity_at = time.monotonic()
 
     def total_responses(self):
         return self.success_responses + self.failed_responses
 
     def item_scheduled(self):
         self.scheduled_items += 1
+        self.last_activity_at = time.monotonic()
 
     def item_scraped_received(self):
         self.scraped_items += 1
+        self.last_activity_at = time.monotonic()
 
     def item_dropped_received(self):
         self.dropped_items += 1
+        self.last_activity_at = time.monotonic()
 
     def item_error_received(self):
         self.error_items += 1
+        self.last_activity_at = time.monotonic()
+
+    def sub_task_request_scheduled(self, index):
+        if self.sub_tasks is None:
+            self.sub_tasks = {}
+        counters = self.sub_tasks.get(index, None)
+        if counters is None:
+            counters = self.sub_tasks[index] = [0, 0, 0]
+        counters[0] += 1
+
+    def sub_task_response_received(self, index, is_success=True):
+        """Returns status of sub-task when all its requests are responded, None otherwise"""
+        if self.sub_tasks is None:
+            return None
+        counters = self.sub_tasks.get(index, None)
+        if counters is None:
+            return None
+        counters[1 if is_success else 2] += 1
+        scheduled, success, failed = counters
+        if success + failed < scheduled:
+            return None
+        del self.sub_tasks[index]
+        if failed == 0:
+            return TaskStatusCodes.SUCCESS
+        if success == 0:
+            return TaskStatusCodes.HARDWARE_ERROR
+        return TaskStatusCodes.PARTIAL_SUCCESS
 
     def total_items(self):
         return self.scraped_items + self.dropped_items + self.error_items
 
     def is_items_completed(self, ignore_zero=True):
-        if ignore_zero is True and self.scheduled_items == 0:
+        scheduled_items = self.scheduled_items
+        if ignore_zero is True and scheduled_items == 0:
             return False
-        return self.scheduled_items == (self.scraped_items + self.dropped_items + self.error_items)
+        return scheduled_items == self.total_items()
 
     def is_requests_completed(self, ignore_zero=True):
-        if ignore_zero is True and self.scheduled_requests == 0:
+        scheduled_requests = self.scheduled_requests
+        if ignore_zero is True and scheduled_requests == 0:
             return False
-        return self.scheduled_requests == (self.success_responses + self.failed_responses)
+        return scheduled_requests == self.total_responses()
+
+    def get_counters(self):
+        return {
+            "scheduled_requests": self.scheduled_requests,
+            "success_responses": self.success_responses,
+            "failed_responses": self.failed_responses,
+            "scheduled_items": self.scheduled_items,
+            "scraped_items": self.scraped_items,
+            "dropped_items": self.dropped_items,
+            "error_items": self.error_items,
+        }
 
     def __repr__(self):
         return json.dumps(
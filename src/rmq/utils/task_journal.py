@@ -0,0 +1,229 @@
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+
+from twisted.internet import defer, task, threads
+
+logger = logging.getLogger(__name__)
+
+
+class TaskJournal:
+    """Append-only local journal of consumed tasks used to recover after crash or restart.
+
+    Task receipt, item publish checkpoints (task counters) and completion are appended as JSON
+    lines keyed by message key. Lines are buffered and group committed (written and fsynced in
+    thread pool) on size or interval. On open journal is replayed: completed keys (with status,
+    expired after ttl seconds) let redelivered tasks be replied and acked without processing,
+    checkpoints tell how far unfinished tasks went.
+    Journal is compacted to completed keys (capped) and checkpoints of unfinished tasks on open
+    and once compact_size bytes are appended since last compaction
+    """
+
+    RECEIVED = "received"
+    CHECKPOINT = "checkpoint"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
+    def __init__(
+        self,
+        path,
+        commit_interval=1.0,
+        commit_size=1000,
+        max_completed=100000,
+        ttl=86400,
+        compact_size=67108864,
+    ):
+        self.path = path
+        self.commit_interval = commit_interval
+        self.commit_size = max(1, int(commit_size))
+        self.max_completed = max(1, int(max_completed))
+        self.ttl = max(0, ttl)
+        self.compact_size = max(0, int(compact_size))
+
+        self.completed = OrderedDict()
+        self.checkpoints = {}
+
+        self.__buffer = []
+        self.__appended_size = 0
+        self.__file = None
+        self.__lock = defer.DeferredLock()
+        self.__commit_task = None
+
+    @classmethod
+    def from_settings(cls, settings):
+        path = settings.get("RMQ_JOURNAL_PATH", None)
+        if not path:
+            return None
+        return cls(
+            path,
+            commit_interval=settings.getfloat("RMQ_JOURNAL_COMMIT_INTERVAL", 1.0),
+            commit_size=settings.getint("RMQ_JOURNAL_COMMIT_SIZE", 1000),
+            max_completed=settings.getint("RMQ_JOURNAL_MAX_COMPLETED", 100000),
+            ttl=settings.getint("RMQ_JOURNAL_TTL", 86400),
+            compact_size=settings.getint("RMQ_JOURNAL_COMPACT_SIZE", 67108864),
+        )
+
+    def open(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._load()
+        self._expire_completed()
+        self._compact(self._get_snapshot_lines())
+        self.__file = open(self.path, "a", encoding="utf-8")
+        self.__commit_task = task.LoopingCall(self.commit)
+        self.__commit_task.start(self.commit_interval, now=False)
+        logger.info(
+            f"Task journal {self.path} opened: {len(self.completed)} completed, "
+            f"{len(self.checkpoints)} unfinished tasks"
+        )
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    event, key = record["event"], record["key"]
+                except (ValueError, KeyError, TypeError):
+                    # Torn line left by crash in the middle of write
+                    continue
+                if event == self.COMPLETED:
+                    self._add_completed(key, record.get("status"), record.get("at"))
+                elif event == self.FAILED:
+                    self.checkpoints.pop(key, None)
+                elif event == self.CHECKPOINT and key not in self.completed:
+                    counters = self.checkpoints.setdefault(key, {})
+                    for name, value in record.get("counters", {}).items():
+                        counters[name] = max(value, counters.get(name, 0))
+
+    def _get_snapshot_lines(self):
+        lines = [
+            self._build_line(self.COMPLETED, key, at=completed_at, status=status)
+            for key, (completed_at, status) in self.completed.items()
+        ]
+        lines.extend(
+            self._build_line(self.CHECKPOINT, key, counters=counters)
+            for key, counters in self.checkpoints.items()
+        )
+        return lines
+
+    def _compact(self, lines):
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.write("".join(lines))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+
+    def compact(self):
+        """Rewrites journal in thread pool to lines of in-memory state, serialized with commits.
+        Lines buffered before are committed first (state already includes them)"""
+        if self.__file is None:
+            return defer.succeed(None)
+        self.commit()
+        self._expire_completed()
+        lines = self._get_snapshot_lines()
+        self.__appended_size = 0
+        d = self.__lock.run(threads.deferToThread, self._rewrite, lines)
+        d.addErrback(lambda failure: logger.error(f"Task journal compaction failed: {failure}"))
+        return d
+
+    def _rewrite(self, lines):
+        if self.__file is None:
+            return
+        self._compact(lines)
+        self.__file.close()
+        self.__file = open(self.path, "a", encoding="utf-8")
+
+    @staticmethod
+    def _build_line(event, key, **fields):
+        record = {"event": event, "key": key}
+        record.update((name, value) for name, value in fields.items() if value is not None)
+        return json.dumps(record) + "\n"
+
+    def _add_completed(self, key, status=None, completed_at=None):
+        """Completed keys are kept in completion order, so expired ones are at the beginning"""
+        self.completed[key] = (completed_at or time.time(), status)
+        self.completed.move_to_end(key)
+        self.checkpoints.pop(key, None)
+        while len(self.completed) > self.max_completed:
+            self.completed.popitem(last=False)
+
+    def _expire_completed(self):
+        if not self.ttl:
+            return
+        expired_at = time.time() - self.ttl
+        while self.completed and next(iter(self.completed.values()))[0] < expired_at:
+            self.completed.popitem(last=False)
+
+    def _append(self, event, key, **fields):
+        self.__buffer.append(self._build_line(event, key, **fields))
+        if len(self.__buffer) >= self.commit_size:
+            self.commit()
+
+    def is_completed(self, key):
+        if key is None:
+            return False
+        self._expire_completed()
+        return key in self.completed
+
+    def get_completed_status(self, key):
+        """Status task was completed with, None if it is unknown or task is not completed"""
+        if not self.is_completed(key):
+            return None
+        return self.completed[key][1]
+
+    def get_checkpoint(self, key):
+        return self.checkpoints.get(key, None)
+
+    def task_received(self, key):
+        if key is not None:
+            self._append(self.RECEIVED, key)
+
+    def checkpoint(self, key, counters: dict):
+        if key is not None:
+            self.checkpoints[key] = counters
+            self._append(self.CHECKPOINT, key, counters=counters)
+
+    def task_failed(self, key):
+        """Checkpoint of nacked task is forgotten, task is processed from the start again"""
+        if key is not None and self.checkpoints.pop(key, None) is not None:
+            self._append(self.FAILED, key)
+
+    def task_completed(self, key, status=None):
+        if key is not None:
+            self._add_completed(key, status)
+            self._append(self.COMPLETED, key, at=self.completed[key][0], status=status)
+
+    def commit(self):
+        """Writes buffered lines in thread pool, commits are serialized to keep lines order"""
+        if not self.__buffer or self.__file is None:
+            return defer.succeed(None)
+        lines, self.__buffer = self.__buffer, []
+        d = self.__lock.run(threads.deferToThread, self._write, lines)
+        d.addErrback(lambda failure: logger.error(f"Task journal commit failed: {failure}"))
+        self.__appended_size += sum(len(line) for line in lines)
+        if self.compact_size and self.__appended_size >= self.compact_size:
+            self.compact()
+        return d
+
+    def _write(self, lines):
+        self.__file.write("".join(lines))
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+
+    def close(self):
+        if self.__commit_task is not None and self.__commit_task.running:
+            self.__commit_task.stop()
+        d = self.commit()
+        d.addBoth(lambda _: self.__lock.run(threads.deferToThread, self._close_file))
+        return d
+
+    def _close_file(self):
+        if self.__file is not None:
+            self.__file.close()
+            self.__file = None
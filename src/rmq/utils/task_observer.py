@@ -4,10 +4,19 @@ from .task import Task
 class TaskObserver:
     def __init__(self):
         self.__tasks = {}
+        self.__listener = None
+
+    def set_listener(self, listener):
+        """Registers in-process listener which receives task events from rmq decorators directly,
+        bypassing signals dispatching (see RPCTaskConsumer direct dispatch mode)"""
+        self.__listener = listener
+
+    def get_listener(self):
+        return self.__listener
 
     def add_task(self, task: Task):
         delivery_tag = task.delivery_tag
-        if delivery_tag in self.__tasks.keys():
+        if delivery_tag in self.__tasks:
             raise ValueError(f"Delivery tag {delivery_tag} is already exists")
         self.__tasks[delivery_tag] = task
 
@@ -18,53 +27,59 @@ class TaskObserver:
         return self.__tasks
 
     def remove_task(self, delivery_tag):
-        try:
-            del self.__tasks[delivery_tag]
-        except KeyError:
-            pass
+        self.__tasks.pop(delivery_tag, None)
 
     def current_processing_count(self):
-        return len(self.__tasks.keys())
+        return len(self.__tasks)
 
     def is_empty(self):
-        return self.current_processing_count() == 0
+        return not self.__tasks
 
     def handle_request(self, delivery_tag):
-        if delivery_tag not in self.__tasks.keys():
-            raise ValueError(f"Delivery tag {delivery_tag} is not exists in observer")
-        self.__tasks[delivery_tag].request_scheduled()
-
-    def handle_response(self, delivery_tag, response_code=200):
         try:
-            if 200 <= response_code < 300:
-                self.__tasks[delivery_tag].success_response_received()
-            else:
-                self.__tasks[delivery_tag].fail_response_received()
+            task = self.__tasks[delivery_tag]
         except KeyError:
-            pass
+            raise ValueError(f"Delivery tag {delivery_tag} is not exists in observer") from None
+        task.request_scheduled()
+
+    def handle_response(self, delivery_tag, response_code=200):
+        task = self.__tasks.get(delivery_tag, None)
+        if task is None:
+            return
+        if 200 <= response_code < 300:
+            task.success_response_received()
+        else:
+            task.fail_response_received()
 
     def handle_item_scheduled(self, delivery_tag):
-        if delivery_tag not in self.__tasks.keys():
-            raise ValueError(f"Delivery tag {delivery_tag} is not exists in observer")
-        self.__tasks[delivery_tag].item_scheduled()
+        try:
+            task = self.__tasks[delivery_tag]
+        except KeyError:
+            raise ValueError(f"Delivery tag {delivery_tag} is not exists in observer") from None
+        task.item_scheduled()
 
     def handle_item_scraped(self, delivery_tag):
-        if delivery_tag not in self.__tasks.keys():
-            raise ValueError(f"Delivery tag {delivery_tag} is not exists in observer")
-        self.__tasks[delivery_tag].item_scraped_received()
+        try:
+            task = self.__tasks[delivery_tag]
+        except KeyError:
+            raise ValueError(f"Delivery tag {delivery_tag} is not exists in observer") from None
+        task.item_scraped_received()
 
     def handle_item_dropped(self, delivery_tag):
-        if delivery_tag not in self.__tasks.keys():
-            raise ValueError(f"Delivery tag {delivery_tag} is not exists in observer")
-        self.__tasks[delivery_tag].item_dropped_received()
+        try:
+            task = self.__tasks[delivery_tag]
+        except KeyError:
+            raise ValueError(f"Delivery tag {delivery_tag} is not exists in observer") from None
+        task.item_dropped_received()
 
     def handle_item_error(self, delivery_tag):
-        if delivery_tag not in self.__tasks.keys():
-            raise ValueError(f"Delivery tag {delivery_tag} is not exists in observer")
-        self.__tasks[delivery_tag].item_error_received()
-
-    def set_status(self, delivery_tag, status):
         try:
-            self.__tasks[delivery_tag].status = status
+            task = self.__tasks[delivery_tag]
         except KeyError:
-            pass
+            raise ValueError(f"Delivery tag {delivery_tag} is not exists in observer") from None
+        task.item_error_received()
+
+    def set_status(self, delivery_tag, status):
+        task = self.__tasks.get(delivery_tag, None)
+        if task is not None:
+            task.status = status
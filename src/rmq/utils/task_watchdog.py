@@ -0,0 +1,56 @@
+import heapq
+import itertools
+import time
+
+
+class TaskWatchdog:
+    """Finds tasks exceeded deadline (since task received) or inactivity timeout (since last
+    request/response/item event) without full scans of processing tasks.
+
+    Tasks are indexed in min-heap by expiry time. Heap entries are not updated on task activity,
+    instead entry of still active task is re-pushed with actual expiry time when popped
+    """
+
+    def __init__(self, deadline=0, inactivity_timeout=0):
+        self.deadline = deadline
+        self.inactivity_timeout = inactivity_timeout
+        self.__heap = []
+        self.__counter = itertools.count()
+
+    def is_enabled(self):
+        return bool(self.deadline or self.inactivity_timeout)
+
+    def get_expiry(self, task):
+        expiries = []
+        if self.deadline:
+            expiries.append(task.created_at + self.deadline)
+        if self.inactivity_timeout:
+            expiries.append(task.last_activity_at + self.inactivity_timeout)
+        return min(expiries)
+
+    def watch(self, task):
+        if not self.is_enabled():
+            return
+        heapq.heappush(
+            self.__heap, (self.get_expiry(task), next(self.__counter), task.delivery_tag)
+        )
+
+    def pop_expired(self, task_observer, now=None):
+        if now is None:
+            now = time.monotonic()
+        expired_tasks = []
+        while len(self.__heap) and self.__heap[0][0] <= now:
+            _expiry, _counter, delivery_tag = heapq.heappop(self.__heap)
+            task = task_observer.get_task(delivery_tag)
+            if task is None:
+                """Task is already completed"""
+                continue
+            expiry = self.get_expiry(task)
+            if expiry > now:
+                heapq.heappush(self.__heap, (expiry, next(self.__counter), delivery_tag))
+                continue
+            expired_tasks.append(task)
+        return expired_tasks
+
+    def __len__(self):
+        return len(self.__heap)